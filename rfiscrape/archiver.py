@@ -5,7 +5,10 @@ from pathlib import Path
 import h5py
 from peewee import fn
 
-from . import config, db
+from . import config, db, util
+
+# Target size of the HDF5 chunks in bytes
+CHUNK_BYTES = 2**20
 
 
 def archive(
@@ -15,32 +18,33 @@ def archive(
     types: list[db.SpectrumType] | None = None,
 ) -> None:
     """Archive a span of data into an HDF5 file."""
-    data = []
-
     if types is None:
         types = [db.SpectrumType.STAGE_1, db.SpectrumType.STAGE_2]
 
-    for spec_type in types:
-        res = db.fetch_rfi(
-            dtstart.timestamp(),
-            dtend.timestamp(),
-            spec_type,
-        )
-        data.append(res)
-
-    time0 = data[0][0]
-    freq0 = data[0][1]
-
-    for t, f, _ in data[1:]:
-        if (t != time0).any() or (f != freq0).any():
-            raise RuntimeError("Can only spectrum types with a single time axis.")
+    # Fetch all the types at once, this ensures they share the same axes
+    time0, freq0, data = db.fetch_rfi_multi(
+        dtstart.timestamp(),
+        dtend.timestamp(),
+        types,
+    )
 
-    with h5py.File(filename, mode="w") as fh:
+    # Use a chunk cache large enough to hold a full row of chunks during the write
+    with h5py.File(
+        filename,
+        mode="w",
+        rdcc_nbytes=64 * CHUNK_BYTES,
+        rdcc_nslots=100003,
+        rdcc_w0=1.0,
+    ) as fh:
         fh.create_dataset("index_map/time", data=time0)
         fh.create_dataset("index_map/freq", data=freq0)
 
-        for st, (_, __, d) in zip(types, data):
-            ds = fh.create_dataset(f"rfi_{st.name.lower()}", data=d)
+        for st, d in data.items():
+            ds = fh.create_dataset(
+                f"rfi_{st.name.lower()}",
+                data=d,
+                **util.hdf5_compression_args(d, CHUNK_BYTES),
+            )
             ds.attrs["axis"] = ["time", "freq"]
 
 
@@ -95,20 +99,30 @@ def main() -> None:
     dtlatest = datetime.datetime.fromtimestamp(latest, tz=datetime.timezone.utc)
     print(f"Buffer holds data from {dtearliest} to {dtlatest}")
 
-    # Truncate to the start of the prior UTC day
-    dtstart = dtearliest.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Find the UTC days which actually have data in the buffer, and the archive files
+    # which already exist
+    days_present = (
+        db.RFIData.select(fn.date(db.RFIData.timestamp, "unixepoch"))
+        .distinct()
+        .tuples()
+    )
+    existing = {p.name for p in Path(conf["directory"]).glob("rfi_*.h5")}
 
-    # Loop over all days in the buffer range, check if the archive file exists and save
-    # it if it doesn't
-    while dtstart + datetime.timedelta(days=1) < dtlatest:
+    # Loop over all complete days in the buffer and save any that haven't been archived
+    for (day,) in sorted(days_present):
+        dtstart = datetime.datetime.fromisoformat(day).replace(
+            tzinfo=datetime.timezone.utc,
+        )
         dtend = dtstart + datetime.timedelta(days=1)
 
-        filename = f"rfi_{dtstart.strftime('%Y%m%d')}.h5"
+        if dtend >= dtlatest:
+            continue
 
-        path = Path(conf["directory"]) / filename
+        filename = f"rfi_{dtstart.strftime('%Y%m%d')}.h5"
 
-        if not path.exists():
-            print(f"Archiving data from {dtstart} to {dtend} into {path}.")
-            archive(path, dtstart=dtstart, dtend=dtend, types=spectrum_types)
+        if filename in existing:
+            continue
 
-        dtstart = dtend
+        path = Path(conf["directory"]) / filename
+        print(f"Archiving data from {dtstart} to {dtend} into {path}.")
+        archive(path, dtstart=dtstart, dtend=dtend, types=spectrum_types)
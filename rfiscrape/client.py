@@ -4,87 +4,114 @@
 # standard library modules from Python 3.6 to work on the GPU nodes.
 
 import argparse
+import array
 import math
 import random
 import re
+import struct
+import sys
 import time
-from email.utils import parsedate_to_datetime
 
 import requests
+from requests.adapters import HTTPAdapter
 
-# Message schema. JSON as:
-# schema = {
-#     "time": UTC,
-#     "freq_id": [ids],
-#     "data": [[[ 3Darray ]]],
-# }
+# Message schema. Sent as a binary blob with content type `application/octet-stream`
+# and all values little endian:
+# header = struct "<ddI" of (time, completion_time, nfreq), both times as UTC
+# freq = nfreq uint32 frequency ids
+# data = 2 * 2 * nfreq int64 counts as a C ordered (stage, type, freq) array
+header_format = "<ddI"
 
-# Regex for selecting the relevant metrics and extracting the required parts
+# Regex for selecting the relevant metrics and extracting the required parts. This
+# operates directly on the raw bytes of the whole response
 metric_pattern = re.compile(
-    r"^kotekan_rfi(?P<stage>broadcast|framedrop)_?(?P<type>\w*)_"
-    r"(?:sample|frame)_total\{.*freq_id=\"(?P<freq>\d+)\"\} (?P<count>\d+)",
+    rb"^kotekan_rfi(?P<stage>broadcast|framedrop)_?(?P<type>\w*)_"
+    rb"(?:sample|frame)_total\{[^}\n]*freq_id=\"(?P<freq>\d+)\"\} (?P<count>\d+)",
+    re.MULTILINE,
 )
 
 
 # Mapping for the locations of the entries we want in the output
-stage_ind = {"broadcast": 0, "framedrop": 1}
-type_ind = {"total": 0, "dropped": 1}
+stage_ind = {b"broadcast": 0, b"framedrop": 1}
+type_ind = {b"total": 0, b"dropped": 1}
 
+# Combined lookup for the position of each (stage, type) pair along the flattened axis.
+# Metrics without a type are totals.
+plane_ind = {
+    (s, t): 2 * si + ti
+    for s, si in stage_ind.items()
+    for t, ti in [*type_ind.items(), (b"", type_ind[b"total"])]
+}
 
-def scrape(target: str, timeout: float) -> dict:
+
+def scrape(session: requests.Session, target: str, timeout: float) -> dict:
     """Scrape the current RFI data from the target.
 
-    Timeout after the given number of seconds.
+    Use the given session so the connection is kept alive between scrapes, and timeout
+    after the given number of seconds.
     """
-    r = requests.get(f"http://{target}/metrics", timeout=timeout)
+    r = session.get(f"http://{target}/metrics", timeout=timeout)
 
-    metrics = r.content.decode().splitlines()
+    # The counts for each frequency present, stored as a list over the flattened
+    # (stage, type) axis
+    counts = {}
 
-    matched_metrics = []
+    # Single pass over the scraped metrics.
+    # Scrape the ones we want and copy the count into the entry for the frequency
+    for mo in metric_pattern.finditer(r.content):
+        stage, type_, f, count = mo.groups()
+        f = int(f)
 
-    freq = set()
+        entry = counts.get(f)
+        if entry is None:
+            entry = counts[f] = [-1, -1, -1, -1]
 
-    # First pass over the scraped metrics.
-    # Scrape the ones we want, massage the contents and determine which frequencies are
-    # present
-    for m in metrics:
-        mo = re.match(metric_pattern, m)
+        plane = plane_ind.get((stage, type_))
+        if plane is None:
+            # Unknown metric
+            continue
 
-        if mo is not None:
-            params = mo.groupdict()
-            params["freq"] = int(params["freq"])
-            params["count"] = int(params["count"])
-            params["type"] = params["type"] or "total"
-            freq.add(params["freq"])
-            matched_metrics.append(params)
+        entry[plane] = int(count)
 
     # Determine the frequency ordering
-    freq_ind = {f: ii for ii, f in enumerate(sorted(freq))}
+    freq = sorted(counts)
 
-    # The output array. We need to explicitly create the entries to avoid shallow copies
-    output = [[[-1] * len(freq_ind) for _ in range(2)] for _ in range(2)]
+    # The flattened (stage, type, freq) output array, missing entries are set to -1
+    entries = [counts[f] for f in freq]
+    output = array.array("q", [e[ii] for ii in range(4) for e in entries])
 
-    # Second pass over the metrics, copy the count over into the correct locations
-    for m in matched_metrics:
-        try:
-            si = stage_ind[m["stage"]]
-            ti = type_ind[m["type"]]
-            fi = freq_ind[m["freq"]]
-        except KeyError:
-            # Unknown metric
-            continue
-
-        output[si][ti][fi] = m["count"]
-
-    timestamp = parsedate_to_datetime(r.headers["Date"]).timestamp()
+    # The local time the scrape completed. The sample time is set separately by the
+    # caller
+    timestamp = time.time()
 
     return {
         "time": timestamp,
-        "freq": sorted(freq),
+        "freq": freq,
         "data": output,
     }
 
 
+def pack(s: dict) -> bytes:
+    """Pack a scraped sample into the binary message format."""
+    nfreq = len(s["freq"])
+    header = struct.pack(
+        f"{header_format}{nfreq}I", s["time"], s["completion_time"], nfreq, *s["freq"]
+    )
+
+    data = array.array("q", s["data"])
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    return header + data.tobytes()
+
+
+def _create_session() -> requests.Session:
+    """Create a session with a single persistent connection."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    return session
+
+
 def main() -> None:
     """Client main loop."""
     # Parse the command line arguments
@@ -113,7 +140,10 @@ def main() -> None:
     push_timeout = args.interval / 4
     server_url = f"http://{args.server}/rfi"
 
-    session = requests.Session()
+    # Use persistent sessions for both scraping and pushing to avoid reconnecting on
+    # every interval. Requests will already ask for gzip compression and keep-alive.
+    scrape_session = _create_session()
+    session = _create_session()
 
     while True:
         # Calculate the next target time, this should be an exact interval boundary
@@ -124,7 +154,7 @@ def main() -> None:
 
         # Fetch the data and insert the sequence ID
         try:
-            s = scrape(args.target, scrape_timeout)
+            s = scrape(scrape_session, args.target, scrape_timeout)
         except (requests.ConnectionError, requests.HTTPError, requests.Timeout):
             continue
 
@@ -139,7 +169,12 @@ def main() -> None:
 
         # Push over to the collection server
         try:
-            session.post(server_url, json=s, timeout=push_timeout)
+            session.post(
+                server_url,
+                data=pack(s),
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=push_timeout,
+            )
         except (requests.ConnectionError, requests.HTTPError, requests.Timeout):
             continue
 
@@ -1,10 +1,11 @@
 """A microservice for collecting the RFI data and writing into a buffer."""
 
+import asyncio
 import logging
+import math
 import queue
 import threading
 import time
-from dataclasses import dataclass, field
 
 import numpy as np
 from aiohttp import web
@@ -19,42 +20,226 @@ logging.getLogger("aiohttp").setLevel(logging.WARN)
 logger = logging.getLogger(__name__)
 
 
-# A type for storing the pushed data in the queue
-@dataclass(order=True)
-class PrioritizedItem:
-    """A simple wrapper for storing prioritized data in the queue."""
-
-    priority: int
-    item: dict = field(compare=False)
-
-
 # A type for storing the assembled data
 class AssembledData:
-    """A simple container for the assembled data."""
+    """A simple container for the assembled data.
+
+    The counts are stored in a single (stage, type, freq) array, with `total` and
+    `dropped` being views of it.
+    """
 
     def __init__(self, timestamp: float, nfreq: int):
         self.timestamp = timestamp
 
-        self.dropped = np.full((2, nfreq), fill_value=np.nan, dtype=np.float32)
-        self.total = np.full((2, nfreq), fill_value=np.nan, dtype=np.float32)
+        self.data = np.full((2, 2, nfreq), fill_value=np.nan, dtype=np.float32)
+        self.total = self.data[:, 0]
+        self.dropped = self.data[:, 1]
+
+
+class AssembledDataPool:
+    """A pool of reusable `AssembledData` buffers.
+
+    This avoids allocating fresh arrays for every timestamp. Buffers may be released
+    from a different thread to the one that acquired them.
+    """
+
+    def __init__(self):
+        self._free = queue.SimpleQueue()
+
+    def acquire(self, timestamp: float, nfreq: int) -> AssembledData:
+        """Get a buffer for the timestamp with all entries reset to NaN."""
+        while True:
+            try:
+                entry = self._free.get_nowait()
+            except queue.Empty:
+                return AssembledData(timestamp, nfreq)
+
+            # Discard any buffers of the wrong size
+            if entry.data.shape[-1] == nfreq:
+                break
+
+        entry.timestamp = timestamp
+        entry.data.fill(np.nan)
+        return entry
+
+    def release(self, entry: AssembledData) -> None:
+        """Return a buffer to the pool once it is no longer used."""
+        self._free.put(entry)
+
+
+# The maximum number of messages waiting for the assembler, and the maximum number of
+# assembled samples waiting to be written. These bound the memory used if either stage
+# stalls.
+MAX_ASSEMBLE_QUEUE = 4096
+MAX_WRITE_QUEUE = 32
+
+# The number of frequency channels being collected
+NFREQ = 1024
+
+# The maximum size of a message from a client in bytes. A binary message for all 1024
+# frequencies is ~37 kB.
+MAX_MESSAGE_SIZE = 2**16
+
+# The assembler orders the entries itself, so this just needs to be a cheap FIFO. This
+# is consumed by the assembler task within the event loop
+assemble_queue = asyncio.Queue(maxsize=MAX_ASSEMBLE_QUEUE)
+write_queue = queue.Queue(maxsize=MAX_WRITE_QUEUE)
+
+# Buffers are acquired by the assembler and returned by the writer
+data_pool = AssembledDataPool()
+
+
+# The header of the binary messages sent by the client. See `client.pack`.
+_header_dtype = np.dtype(
+    [("time", "<f8"), ("completion_time", "<f8"), ("nfreq", "<u4")],
+)
+
+
+def decode_message(buf: bytes, nfreq: int = NFREQ) -> dict:
+    """Decode a binary message from the client into the message schema.
+
+    Parameters
+    ----------
+    buf
+        The binary message.
+    nfreq
+        The number of frequencies being collected. All frequency ids must be less
+        than this.
+
+    Returns
+    -------
+    message
+        A dictionary with the `time` and `completion_time` as floats, and the `freq` and
+        `data` entries as arrays.
+
+    Raises
+    ------
+    ValueError
+        If the message is malformed.
+    """
+    hsize = _header_dtype.itemsize
+
+    if len(buf) < hsize:
+        raise ValueError("Could not decode message.")
+
+    header = np.frombuffer(buf, dtype=_header_dtype, count=1)[0]
+    nmsg = int(header["nfreq"])
+
+    # Check the length is consistent before decoding the arrays
+    if len(buf) != hsize + (4 + 2 * 2 * 8) * nmsg:
+        raise ValueError("Could not decode message.")
 
+    freq = np.frombuffer(buf, dtype="<u4", count=nmsg, offset=hsize)
+    data = np.frombuffer(buf, dtype="<i8", offset=hsize + 4 * nmsg)
+    data = data.reshape(2, 2, nmsg)
 
-assemble_queue = queue.PriorityQueue()
-write_queue = queue.Queue()
+    message = {
+        "time": float(header["time"]),
+        "completion_time": float(header["completion_time"]),
+        "freq": freq,
+        "data": data,
+    }
+    _check_message(message, nfreq)
+
+    return message
+
+
+def _check_message(message: dict, nfreq: int) -> None:
+    """Check the time and frequencies of a decoded message are usable."""
+    if not math.isfinite(message["time"]):
+        raise ValueError("Invalid message time.")
+
+    freq = message["freq"]
+    if freq.size and (freq.min() < 0 or freq.max() >= nfreq):
+        raise ValueError("Frequency indices out of range.")
+
+
+def validate_message(body: object, nfreq: int = NFREQ) -> dict:
+    """Check a JSON message from an older client and convert it to the message schema.
+
+    Parameters
+    ----------
+    body
+        The parsed JSON body.
+    nfreq
+        The number of frequencies being collected. All frequency ids must be less
+        than this.
+
+    Returns
+    -------
+    message
+        A dictionary with the `time` as a float, and the `freq` and `data` entries as
+        arrays.
+
+    Raises
+    ------
+    ValueError
+        If the message is missing entries or they have the wrong types or shapes.
+    """
+    try:
+        message = {
+            "time": float(body["time"]),
+            "freq": np.asarray(body["freq"], dtype=np.intp),
+            "data": np.asarray(body["data"], dtype=np.float32),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid message.") from e
 
+    nmsg = len(message["freq"])
+    if message["freq"].ndim != 1 or message["data"].shape != (2, 2, nmsg):
+        raise ValueError("Invalid message.")
+    _check_message(message, nfreq)
 
-# A very simple async receiver, just push the data into a queue for another thread to
-# consume
+    return message
+
+
+# A very simple async receiver, just push the data into a queue for the assembler task
+# to consume
 async def receive_rfi(request: web.Request) -> web.Response:
     """Handler for receiving RFI stats from the clients."""
-    body = await request.json()
+    # Continue to accept JSON messages from older clients. Invalid JSON also raises a
+    # ValueError
+    if request.content_type == "application/json":
+        try:
+            body = validate_message(await request.json())
+        except ValueError as e:
+            raise web.HTTPBadRequest(reason="Invalid message.") from e
+    else:
+        try:
+            body = decode_message(await request.read())
+        except ValueError as e:
+            raise web.HTTPBadRequest(reason="Could not decode message.") from e
 
-    assemble_queue.put(PrioritizedItem(priority=body["time"], item=body))
+    # If the assembler is not keeping up, tell the client rather than queueing more
+    try:
+        assemble_queue.put_nowait(body)
+    except asyncio.QueueFull as e:
+        raise web.HTTPServiceUnavailable(reason="Collector is overloaded.") from e
 
     return web.Response()
 
 
-def assembler(window: int, nfreq: int) -> None:
+def _put_drop_oldest(item: AssembledData) -> None:
+    """Put an item into the write queue, dropping the oldest item if it is full."""
+    while True:
+        try:
+            write_queue.put_nowait(item)
+        except queue.Full:
+            pass
+        else:
+            return
+
+        try:
+            dropped = write_queue.get_nowait()
+        except queue.Empty:
+            # The writer took an item in the meantime, so just try again
+            continue
+        write_queue.task_done()
+        logger.warning(f"Write queue full. Dropping sample {dropped.timestamp}.")
+        data_pool.release(dropped)
+
+
+async def assembler(window: int, nfreq: int) -> None:
     """A worker to take the entries for each time/freq combo and assemble into samples.
 
     Parameters
@@ -68,21 +253,11 @@ def assembler(window: int, nfreq: int) -> None:
 
     def _create(timestamp: float):
         def f():
-            return AssembledData(timestamp, nfreq)
+            return data_pool.acquire(timestamp, nfreq)
 
         return f
 
-    while True:
-        v = assemble_queue.get()
-        assemble_queue.task_done()
-
-        # If we get None that is the signal we should cleanup and exit, so we break from
-        # this loop
-        if v is None:
-            break
-
-        data = v.item
-
+    def _add(data: dict) -> None:
         timestamp = data["time"]
 
         # Successful completion of this block should ensure that an entry for this
@@ -95,43 +270,56 @@ def assembler(window: int, nfreq: int) -> None:
                 f"Received an entry with too old a timestamp {timestamp}. "
                 f"Current oldest {oldest}",
             )
-            continue
+            return
 
         # We pushed out an old value, so we need to send it on for the next processing
         # stage
         if oldkey is not None:
-            write_queue.put(oldvalue)
+            _put_drop_oldest(oldvalue)
 
         # Update the entry fot this timestamp
         entry = entries[timestamp]
-        freq_ind = np.array(data["freq"])
-
-        if (freq_ind >= nfreq).any() or (freq_ind < 0).any():
-            raise ValueError("Frequency indices out of range.")
-
-        counts = np.array(data["data"]).astype(np.float32)
+        freq_ind = np.asarray(data["freq"], dtype=np.intp)
+        counts = np.asarray(data["data"], dtype=np.float32)
 
         try:
-            entry.dropped[:, freq_ind] = counts[:, 1]
-            entry.total[:, freq_ind] = counts[:, 0]
+            entry.data[:, :, freq_ind] = counts
         except IndexError:
             logger.exception(f"Issue with indexing skipping. {freq_ind=}")
 
-    # We need to pass all the current entries along to get written out
-    while len(entries) > 0:
-        write_queue.put(entries.pop()[1])
+    while True:
+        data = await assemble_queue.get()
 
-    # Send a None to the writing stages to have them exit
-    write_queue.put(None)
+        # If we get None that is the signal we should cleanup and exit, so we break from
+        # this loop
+        if data is None:
+            break
 
-    # Wait until the writer exits
-    write_queue.join()
+        # A bad message must not stop the assembler, so just log it and move on
+        try:
+            _add(data)
+        except Exception:
+            logger.exception("Could not assemble message. Skipping.")
+
+    # We need to pass all the current entries along to get written out. On shutdown
+    # nothing should be dropped, so wait for space in the queue rather than discarding
+    # the oldest entries
+    loop = asyncio.get_running_loop()
+    while len(entries) > 0:
+        await loop.run_in_executor(None, write_queue.put, entries.pop()[1])
+
+    # Send a None to the writing stages to have them exit. This must not be dropped
+    # either, and then wait until the writer exits
+    await loop.run_in_executor(None, write_queue.put, None)
+    await loop.run_in_executor(None, write_queue.join)
 
 
 def writer(
     output_file: str,
     buffer_time: float,
     purge_interval: float,
+    batch_size: int = 4,
+    flush_interval: float = 30.0,
 ) -> None:
     """Write out the data into a sqlite buffer.
 
@@ -146,17 +334,38 @@ def writer(
         The length of the buffer to maintain.
     purge_interval
         How often to remove expired samples in seconds.
+    batch_size
+        The number of samples to accumulate before inserting them into the database
+        in a single transaction.
+    flush_interval
+        The maximum time in seconds to hold pending samples before inserting them.
     """
     db.connect(output_file, readonly=False)
 
     prev = None
 
+    # Rows waiting to be inserted into the database
+    pending = []
+    last_flush = time.time()
+
+    def _flush() -> None:
+        nonlocal last_flush
+        if pending:
+            db.insert_rfi(pending)
+            pending.clear()
+        last_flush = time.time()
+
     # Set the last_purge to be at the epoch to ensure we purge at the first run, and
     # determine how often to purge.
     last_purge = 0.0
 
     while True:
-        item = write_queue.get()
+        try:
+            item = write_queue.get(timeout=flush_interval)
+        except queue.Empty:
+            # Nothing has arrived for a while, so write out anything we are holding
+            _flush()
+            continue
         write_queue.task_done()
 
         # None indicates we won't get any more data, so we just exit the loop
@@ -167,11 +376,17 @@ def writer(
 
         if prev is None:
             prev = data
+
+            # Scratch space for calculating the dropped fraction, reused each sample
+            diff = np.empty_like(data.data)
+            dropped_frac = np.empty_like(data.dropped)
             continue
 
         # Calculate the amount of dropped samples between the current and previous
-        # samples, and the reset the `prev` ref
-        dropped_frac = (data.dropped - prev.dropped) / (data.total - prev.total)
+        # samples in place, and the reset the `prev` ref
+        np.subtract(data.data, prev.data, out=diff)
+        np.divide(diff[:, 1], diff[:, 0], out=dropped_frac)
+        data_pool.release(prev)
         prev = data
 
         # Log some output
@@ -181,35 +396,43 @@ def writer(
             f"stage1={avg_excision[0]:.3%} stage2={avg_excision[1]:.3%}",
         )
 
-        db.RFIData.create(
-            timestamp=data.timestamp,
-            freq_chunk=0,
-            spectrum_type=db.SpectrumType.STAGE_1,
-            encoding_type=db.EncodingType.RAW,
-            data=dropped_frac[0].data,
-        )
-        db.RFIData.create(
-            timestamp=data.timestamp,
-            freq_chunk=0,
-            spectrum_type=db.SpectrumType.STAGE_2,
-            encoding_type=db.EncodingType.RAW,
-            data=dropped_frac[1].data,
+        # The fractions are stored quantised to reduce the size of the buffer
+        encoding = db.EncodingType.U16_FRAC
+        pending.extend(
+            (
+                data.timestamp,
+                0,
+                spec_type.value,
+                encoding.value,
+                db.encode(spec_type, encoding, dropped_frac[ii]),
+            )
+            for ii, spec_type in enumerate(
+                [db.SpectrumType.STAGE_1, db.SpectrumType.STAGE_2]
+            )
         )
 
+        # Read the clock once for both the flush and purge checks below
+        now = time.time()
+
+        # Insert the accumulated rows in a single transaction
+        if len(pending) >= 2 * batch_size or (now - last_flush) > flush_interval:
+            _flush()
+
         # Check how long it's been since we purged old record, and if it's been too long
-        # DELETE anything older than the buffer_time
-        if (time.time() - last_purge) > purge_interval:
-            oldest_record = time.time() - buffer_time
+        # DELETE anything older than the buffer_time. This is a range delete on the
+        # timestamp index.
+        if (now - last_purge) > purge_interval:
             delete_query = db.RFIData.delete().where(
-                db.RFIData.timestamp < oldest_record,
+                db.RFIData.timestamp < now - buffer_time,
             )
 
             records_deleted = delete_query.execute()
 
             logger.info(f"Purged {records_deleted} expired records.")
-            last_purge = time.time()
+            last_purge = now
 
-    # Close the database to allow in all to get synced
+    # Write out anything remaining and close the database to allow in all to get synced
+    _flush()
     db.close()
 
 
@@ -223,31 +446,37 @@ def main() -> None:
         sections=["common", "collector"],
         configbase="rfiscrape",
     )
-    nfreq = 1024
 
     # Convert the purge config into an actual interval in seconds
     if conf["purge"] <= 0:
         raise ValueError("Purge interval must be positive.")
     purge = conf["time"] * conf["purge"] if conf["purge"] < 1 else conf["purge"]
 
-    # Start the assembly and writing threads
-    assembler_thread = threading.Thread(target=assembler, args=(conf["window"], nfreq))
+    # Start the writing thread. This stays in its own thread as the database access is
+    # synchronous
     writer_thread = threading.Thread(
         target=writer, args=(conf["buffer"], conf["time"], purge)
     )
-    assembler_thread.start()
     writer_thread.start()
 
+    # Run the assembler as a task within the server event loop
+    async def assembler_ctx(_app: web.Application):
+        task = asyncio.create_task(assembler(conf["window"], NFREQ))
+
+        yield
+
+        # On shutdown we need to flush and close the assembler and writer. We do this by
+        # placing the None sentinel into the queue which signals a shutdown
+        logger.info("Shutting down assembler.")
+        await assemble_queue.put(None)
+        await task
+
     # Start the collector HTTP server on the main thread
-    app = web.Application()
+    app = web.Application(client_max_size=MAX_MESSAGE_SIZE)
     app.add_routes([web.post("/rfi", receive_rfi)])
+    app.cleanup_ctx.append(assembler_ctx)
     web.run_app(app, port=conf["port"])
 
-    # If this exits then we need to flush and close the threads. We do this by placing
-    # the None sentinel into the queue which signals a shutdown
-    logger.info("Shutting down threads.")
-    assemble_queue.put(None)
-    assembler_thread.join()
     writer_thread.join()
     logger.info("Exiting.")
 
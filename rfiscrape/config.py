@@ -1,7 +1,9 @@
 """Tools for loading the configuration from files or CLI args."""
 import argparse
+import copy
+import functools
 import logging
-from collections.abc import Callable
+from collections.abc import Callable, Hashable
 from pathlib import Path
 from typing import Any, Generic, TypeVar
 
@@ -9,6 +11,9 @@ import yaml
 
 logger = logging.getLogger(__name__)
 
+# Use the libyaml based loader if it is available
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 T = TypeVar("T")
 
 
@@ -107,7 +112,7 @@ def process_args_and_config(  # noqa: PLR0913
         The final config.
     """
     # Build a dict of the fuly qualified config parameters to use
-    flattened_params = _flatten_dict(_get_sections(schema, sections))
+    flattened_params = _schema_params(schema, sections)
 
     # Create an argument parser with the overriding arguments
     parser = argparse.ArgumentParser(prog=prog, description=description)
@@ -153,7 +158,37 @@ def load_standard_config_files(
     Returns
     -------
     list
-        A list of the config entries as dictionaries. Missing files are omitted.
+        A list of the flattened config entries as dictionaries. Missing files are
+        omitted.
+    """
+    config = []
+
+    for abspath in _candidate_paths(name, extra_file, Path.cwd()):
+        # Missing files are skipped. The modification time is used to only reparse
+        # files which have changed since they were last loaded
+        try:
+            mtime = abspath.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+        # Take a copy so the cached entry can't be modified by the caller
+        conf = copy.deepcopy(_load_file(abspath, mtime))
+
+        # Flatten and then extract and merge any sections
+        conf = _filter_sections(_flatten_dict(conf), sections)
+        config.append(conf)
+
+    return config
+
+
+@functools.lru_cache(maxsize=32)
+def _candidate_paths(
+    name: str, extra_file: str | None, cwd: Path  # noqa: ARG001
+) -> tuple[Path, ...]:
+    """Get the expanded paths of the config files to try in order of precedence.
+
+    Relative paths are resolved against the working directory, so this is included
+    in the cache key.
     """
     config_files = [
         f"~/.config/{name}/{name}.conf",
@@ -163,25 +198,20 @@ def load_standard_config_files(
     if extra_file:
         config_files = [extra_file, *config_files]
 
-    config = []
-
-    for cfile in config_files:
-        # Expand the configuration file path
-        abspath = Path(cfile).expanduser().absolute()
+    return tuple(Path(cfile).expanduser().absolute() for cfile in config_files)
 
-        if not abspath.exists():
-            continue
-
-        logger.debug(f"Loading config file {abspath}")
 
-        with abspath.open("r") as fh:
-            conf = yaml.safe_load(fh)
+@functools.lru_cache(maxsize=32)
+def _load_file(abspath: Path, mtime: int) -> dict:  # noqa: ARG001
+    """Parse a config file.
 
-        # Extract and merge any sections
-        conf = _get_sections(conf, sections)
-        config.append(conf)
+    This is cached on the path and modification time of the file.
+    """
+    logger.debug(f"Loading config file {abspath}")
 
-    return config
+    # Open in binary mode and let YAML handle the decoding
+    with abspath.open("rb") as fh:
+        return yaml.load(fh, Loader=YamlLoader)  # noqa: S506
 
 
 def resolve_config(
@@ -189,9 +219,12 @@ def resolve_config(
     cli_args: dict,
     file_config: list[dict],
 ) -> dict:
-    """Resolve all source to a final config."""
+    """Resolve all source to a final config.
+
+    The file configs must already be flattened.
+    """
     # Filter out unknown params
-    allowed_keys = set(params.keys())
+    allowed_keys, defaults, converters = _schema_info(params)
 
     # Ensure that we only include valid keys from the config files
     def _filter_file(d: dict[str, Any]) -> dict[str, any]:
@@ -202,23 +235,76 @@ def resolve_config(
         return {k: v for k, v in d.items() if not (k in allowed_keys and v is None)}
 
     # Initialise with the defaults
-    resolved_params = {name: p.default for name, p in params.items()}
+    resolved_params = defaults.copy()
 
     # The go through the files (backwards to maintain the overriding precedence)
     for conf in reversed(file_config):
-        resolved_params |= _filter_file(_flatten_dict(conf))
+        resolved_params |= _filter_file(conf)
 
     # Then finally override with any CLI args. Don't filter this one in case any extra
     # arguments are added.
     resolved_params |= _filter_cli(cli_args)
 
-    # Ensure that any type conversion is done
+    # Ensure that any type conversion is done. This is equivalent to calling
+    # `Param.get_value` for each known key.
     return {
-        k: (params[k].get_value(v) if k in params else v)
+        k: (conv(v) if v is not None and (conv := converters.get(k)) else v)
         for k, v in resolved_params.items()
     }
 
 
+# Caches of the flattened params for each schema, and the derived info for each set of
+# params. Keyed by the id, but holding a reference to the object to ensure the id
+# can't be reused. Only the most recent few entries are kept, as in practice only one
+# or two schemas are ever used.
+_CACHE_SIZE = 8
+_params_cache: dict[tuple, tuple[dict, dict[str, Param]]] = {}
+_schema_cache: dict[
+    int,
+    tuple[dict[str, Param], frozenset[str], dict[str, Any], dict[str, Callable]],
+] = {}
+
+
+def _cache_put(cache: dict, key: Hashable, value: object) -> None:
+    """Insert into one of the schema caches, evicting the oldest entries if full."""
+    cache.pop(key, None)
+    cache[key] = value
+    while len(cache) > _CACHE_SIZE:
+        del cache[next(iter(cache))]
+
+
+def _schema_params(schema: dict, sections: list[str] | None) -> dict[str, Param]:
+    """Get the flattened params for the given sections of the schema."""
+    key = (id(schema), None if sections is None else tuple(sections))
+    cached = _params_cache.get(key)
+
+    if cached is None or cached[0] is not schema:
+        # Empty sections of the schema don't define any parameters
+        flat = _flatten_dict(_get_sections(schema, sections))
+        cached = (schema, {k: v for k, v in flat.items() if isinstance(v, Param)})
+        _cache_put(_params_cache, key, cached)
+
+    return cached[1]
+
+
+def _schema_info(
+    params: dict[str, Param],
+) -> tuple[frozenset[str], dict[str, Any], dict[str, Callable]]:
+    """Get the allowed keys, the defaults and the type converters for the params."""
+    cached = _schema_cache.get(id(params))
+
+    if cached is None or cached[0] is not params:
+        cached = (
+            params,
+            frozenset(params),
+            {name: p.default for name, p in params.items()},
+            {name: p.conv or p.ptype for name, p in params.items()},
+        )
+        _cache_put(_schema_cache, id(params), cached)
+
+    return cached[1:]
+
+
 # create_argparser("a", "d", ["common", "archiver"]).parse_args()
 # conf = create_argparser("a", "d")
 # print(conf)
@@ -227,34 +313,58 @@ def resolve_config(
 def _flatten_dict(d: dict[str, Any], sep: str = ".") -> dict[str, Any]:
     """Flatten nested dictionaries into a single layer.
 
-    The final keys are separated by `sep`.
+    The final keys are separated by `sep`. Empty nested dictionaries are kept as an
+    empty dictionary entry so that their presence is not lost.
     """
-    stack = [("", d)]
+    if not d and type(d) is dict:
+        return {}
 
     flat_dict = {}
 
-    # Walk through nested dictionary putting items onto a stack for processing
-    while stack:
-        stem, entry = stack.pop()
+    # Recursively walk through the nested dictionary. Terminal items and empty
+    # dictionaries are placed directly in the final dictionary
+    def _walk(stem: str, entry: dict[str, Any]) -> None:
+        for key, value in entry.items():
+            if not isinstance(key, str):
+                raise TypeError("Only string keys are supported.")
+            if sep in key:
+                raise ValueError("String cannot contain the separator.")
 
-        # If a dict, put all it's items onto the stack (backwards to preserve the order)
-        if isinstance(entry, dict):
-            for key in reversed(entry):
-                if not isinstance(key, str):
-                    raise TypeError("Only string keys are supported.")
-                if sep in key:
-                    raise ValueError("String cannot contain the separator.")
+            newkey = f"{stem}{sep}{key}" if stem else key
 
-                newkey = f"{stem}{sep}{key}" if stem else key
+            if type(value) is dict and value:
+                _walk(newkey, value)
+            else:
+                flat_dict[newkey] = value
 
-                stack.append((newkey, entry[key]))
-        else:
-            # Otherwise terminal items are placed in the final dictionary
-            flat_dict[stem] = entry
+    if type(d) is dict:
+        _walk("", d)
+    else:
+        flat_dict[""] = d
 
     return flat_dict
 
 
+def _filter_sections(
+    flat: dict[str, Any], sections: list[str] | None, sep: str = "."
+) -> dict[str, Any]:
+    """Extract the named sections from a flattened dict and return the merged result.
+
+    Later sections take precedence over earlier ones.
+    """
+    if sections is None:
+        return flat
+
+    new_dict = {}
+
+    for section in sections:
+        prefix = section + sep
+        n = len(prefix)
+        new_dict |= {k[n:]: v for k, v in flat.items() if k.startswith(prefix)}
+
+    return new_dict
+
+
 def _get_sections(d: dict, sections: list[str] | None) -> dict:
     """Extract the named section keys from d and return the merged result."""
     if sections is None:
@@ -10,7 +10,7 @@ database = pw.SqliteDatabase(None)
 
 E = TypeVar("E", bound=Enum)
 
-__schema_version__ = "2023.11"
+__schema_version__ = "2026.10"
 
 
 class EnumField(pw.SmallIntegerField):
@@ -53,6 +53,13 @@ class EncodingType(Enum):
 
     RAW = 0
     LOG_BITSHUFFLE = 1
+    U16_FRAC = 2
+
+
+# The maximum quantised value for the U16_FRAC encoding, the next value up is used to
+# mark missing data
+U16_FRAC_MAX = 2**16 - 2
+U16_FRAC_NAN = 2**16 - 1
 
 
 class RFIData(BaseModel):
@@ -86,6 +93,14 @@ class RFIData(BaseModel):
 
     data = pw.BlobField()
 
+    class Meta:
+        """Meta info."""
+
+        # The fetch queries select on the spectrum type, a time range and optionally
+        # the frequency chunks, so these can all be checked from the index. The index
+        # on just the timestamp is still used by the purge and archiver queries
+        indexes = ((("spectrum_type", "timestamp", "freq_chunk"), False),)
+
 
 def connect(filename: str, readonly: bool = True) -> None:
     """Connect to the database.
@@ -115,25 +130,111 @@ def connect(filename: str, readonly: bool = True) -> None:
         },
     )
 
-    # Ensure all the tables are created
+    # Ensure all the tables are created. This also adds any missing indexes to
+    # existing tables
     if not readonly:
         database.create_tables(BaseModel.__subclasses__(), safe=True)
 
 
+def encode(spec: SpectrumType, enc: EncodingType, data: np.ndarray) -> bytes:
+    """Encode a spectrum into the data blob for an RFIData entry.
+
+    For the `U16_FRAC` encoding the values are clipped into [0, 1] and quantised into
+    uint16 values. Missing (NaN) entries are preserved.
+    """
+    if spec not in (SpectrumType.STAGE_1, SpectrumType.STAGE_2):
+        raise ValueError("Cannot encode data.")
+
+    if enc == EncodingType.RAW:
+        return np.asarray(data, dtype=np.float32).tobytes()
+
+    if enc == EncodingType.U16_FRAC:
+        quantised = np.rint(np.clip(data, 0.0, 1.0) * U16_FRAC_MAX)
+        quantised[np.isnan(data)] = U16_FRAC_NAN
+        return quantised.astype("<u2").tobytes()
+
+    raise ValueError("Cannot encode data.")
+
+
+def insert_rfi(rows: list[tuple[float, int, int, int, bytes]]) -> None:
+    """Insert many rows into the RFIData table in a single transaction.
+
+    This bypasses the ORM and uses a single prepared statement for all rows.
+
+    Parameters
+    ----------
+    rows
+        The rows to insert as (timestamp, freq_chunk, spectrum_type, encoding_type,
+        data) tuples. The spectrum and encoding types must be given as their integer
+        values.
+    """
+    sql = (
+        "INSERT INTO rfidata "
+        "(timestamp, freq_chunk, spectrum_type, encoding_type, data) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+
+    with database.atomic():
+        database.cursor().executemany(sql, rows)
+
+
 def decode(spec: SpectrumType, enc: EncodingType, data: bytes) -> np.ndarray:
     """Decode the data in the RFIData result."""
-    if enc == EncodingType.RAW and spec in (SpectrumType.STAGE_1, SpectrumType.STAGE_2):
+    if spec not in (SpectrumType.STAGE_1, SpectrumType.STAGE_2):
+        raise ValueError("Cannot decode data.")
+
+    if enc == EncodingType.RAW:
         return np.frombuffer(data, dtype=np.float32, count=-1)
 
+    if enc == EncodingType.U16_FRAC:
+        quantised = np.frombuffer(data, dtype="<u2", count=-1)
+        decoded = quantised.astype(np.float32)
+        decoded *= np.float32(1.0 / U16_FRAC_MAX)
+        decoded[quantised == U16_FRAC_NAN] = np.nan
+        return decoded
+
     raise ValueError("Cannot decode data.")
 
 
+def decode_many(
+    spec: SpectrumType, enc: EncodingType, blobs: list[bytes], chunksize: int
+) -> np.ndarray:
+    """Decode the data from many RFIData results at once.
+
+    The blobs are joined and decoded in a single call, which avoids creating an array
+    for every row.
+
+    Parameters
+    ----------
+    spec, enc
+        The spectrum and encoding type shared by all the blobs.
+    blobs
+        The data blobs to decode.
+    chunksize
+        The number of samples in each blob.
+
+    Returns
+    -------
+    data
+        The decoded data of shape (len(blobs), chunksize).
+
+    Raises
+    ------
+    ValueError
+        If the data can't be decoded, or any blob is the wrong size.
+    """
+    if len(set(map(len, blobs))) > 1:
+        raise ValueError("Cannot decode data of inconsistent sizes.")
+
+    return decode(spec, enc, b"".join(blobs)).reshape(len(blobs), chunksize)
+
+
 def fetch_rfi(
     start_time: float,
     end_time: float,
     spec_type: SpectrumType,
-    freq_start: float | None = None,
-    freq_end: float | None = None,
+    freq_start: int | None = None,
+    freq_end: int | None = None,
 ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Read RFI information from the buffer db.
 
@@ -144,7 +245,7 @@ def fetch_rfi(
     spec_type
         Which spectrum to fetch.
     freq_start, freq_end
-        The frequency range to fetch in MHz.
+        The range of frequency IDs to fetch. The end is exclusive.
 
     Returns
     -------
@@ -153,51 +254,139 @@ def fetch_rfi(
     freq
         The frequencies in the range.
     data
-        The 2D dataset. Missing data is marked with np.nan.
+        The 2D dataset. Missing data is marked with np.nan. If a frequency range is
+        given this is a view into a larger array and may not be contiguous.
     """
-    query = RFIData.select().where(RFIData.spectrum_type == spec_type)
-    query = query.where(RFIData.timestamp >= start_time, RFIData.timestamp < end_time)
+    timestamps, freq, data = fetch_rfi_multi(
+        start_time, end_time, [spec_type], freq_start, freq_end
+    )
+
+    return timestamps, freq, data[spec_type]
 
-    # Add the frequency constraints if set
-    # if freq_start:
-    #     query = query.where(db.RFIData.freq_low < freq_end)
-    # if freq_end:
-    #     query = query.where(db.RFIData.freq_high > freq_start)
 
-    results = list(query)
+def fetch_rfi_multi(
+    start_time: float,
+    end_time: float,
+    spec_types: list[SpectrumType],
+    freq_start: int | None = None,
+    freq_end: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, dict[SpectrumType, np.ndarray]]:
+    """Read RFI information for several spectrum types from the buffer db.
 
-    # Get the list of timestamps. Use a set as they may be multiple frequency chunks
-    timestamps = np.array(sorted({r.timestamp for r in results}))
+    All the spectra share the same time and frequency axes. These are given by all the
+    times and frequency chunks present for the requested spectra, independent of the
+    frequency range.
 
-    ts_map = {ts: ii for ii, ts in enumerate(timestamps)}
+    Parameters
+    ----------
+    start_time, end_time
+        The start and end time to fetch as UTC Unix times.
+    spec_types
+        Which spectra to fetch.
+    freq_start, freq_end
+        The range of frequency IDs to fetch. The end is exclusive.
 
-    chunks = sorted({r.freq_chunk for r in results})  # This should by [0]
+    Returns
+    -------
+    time
+        The times in the range.
+    freq
+        The frequencies in the range.
+    data
+        The 2D dataset for each spectrum type. Missing data is marked with np.nan. If
+        a frequency range is given this is a view into a larger array and may not be
+        contiguous.
+    """
     chunksize = 1024  # TODO: look this up from the spectrum/encoding type
 
-    if chunks:
-        freq = np.arange(
-            chunks[0] * chunksize, (chunks[-1] + 1) * chunksize, dtype=np.int32
+    def _constrain(query: pw.ModelSelect) -> pw.ModelSelect:
+        query = query.where(RFIData.spectrum_type.in_(spec_types))
+        return query.where(
+            RFIData.timestamp >= start_time, RFIData.timestamp < end_time
+        )
+
+    # Only read the data for the chunks which overlap the frequency range
+    query = _constrain(
+        RFIData.select(
+            RFIData.timestamp,
+            RFIData.freq_chunk,
+            RFIData.spectrum_type,
+            RFIData.encoding_type,
+            RFIData.data,
         )
+    )
+    if freq_start is not None:
+        query = query.where(RFIData.freq_chunk >= freq_start // chunksize)
+    if freq_end is not None:
+        query = query.where(RFIData.freq_chunk <= (freq_end - 1) // chunksize)
+
+    # Read the rows directly from the cursor, this bypasses peewee's per row processing
+    # and gives us the raw sqlite values. The enum types are only constructed once per
+    # group below
+    rows = database.execute(query).fetchall()
+    ts_col, chunk_col, st_col, enc_col, blobs = zip(*rows) if rows else ((),) * 5
+
+    # Find all the times and frequency chunks present. These set the output axes, so
+    # they must not depend on the frequency range requested. If a range was given get
+    # them from the index alone, otherwise the rows already contain them all
+    if freq_start is None and freq_end is None:
+        axes_ts, axes_chunk = ts_col, chunk_col
     else:
-        freq = np.zeros((0,), dtype=np.int32)
+        axes_query = _constrain(
+            RFIData.select(RFIData.timestamp, RFIData.freq_chunk).distinct()
+        )
+        axes_rows = database.execute(axes_query).fetchall()
+        axes_ts, axes_chunk = zip(*axes_rows) if axes_rows else ((), ())
+
+    # There may be multiple frequency chunks per time so we need to remove duplicates
+    timestamps = np.unique(np.array(axes_ts, dtype=np.float64))
+    chunk_min = min(axes_chunk, default=0)
+    nchunks = max(axes_chunk) - chunk_min + 1 if axes_chunk else 0
+
+    # Get the output position of each row
+    ti = np.searchsorted(timestamps, np.array(ts_col, dtype=np.float64))
+    ci = np.array(chunk_col, dtype=np.intp) - chunk_min
+
+    freq = np.arange(
+        chunk_min * chunksize, (chunk_min + nchunks) * chunksize, dtype=np.int32
+    )
+
+    output_data = {
+        st: np.full(
+            (len(timestamps), nchunks, chunksize),
+            fill_value=np.nan,
+            dtype=np.float32,
+        )
+        for st in spec_types
+    }
 
-    output_data = np.full(
-        (len(timestamps), len(chunks), chunksize), fill_value=np.nan, dtype=np.float32
+    # Group the rows by their spectrum and encoding type, so each group can be decoded
+    # from a single concatenated buffer and copied into place in one go
+    group_key = np.array(st_col, dtype=np.int64) << 16 | np.array(
+        enc_col, dtype=np.int64
     )
+    group_keys, group_ind = np.unique(group_key, return_inverse=True)
+
+    for gi, key in enumerate(group_keys.tolist()):
+        if len(group_keys) == 1:
+            sel, group_blobs = slice(None), blobs
+        else:
+            sel = np.flatnonzero(group_ind == gi)
+            group_blobs = [blobs[ii] for ii in sel.tolist()]
 
-    for r in results:
-        ti = ts_map[r.timestamp]
-        ci = 0
+        st, enc = SpectrumType(key >> 16), EncodingType(key & 0xFFFF)
+        output_data[st][ti[sel], ci[sel]] = decode_many(st, enc, group_blobs, chunksize)
 
-        output_data[ti, ci] = decode(spec_type, r.encoding_type, r.data)
+    # Find the part of the fetched chunks within the requested range
+    fstart = 0 if freq_start is None else np.searchsorted(freq, freq_start)
+    fend = len(freq) if freq_end is None else np.searchsorted(freq, freq_end)
 
-    # Flatten across chunks
-    output_data = output_data.reshape(len(timestamps), -1)
+    for st, d in output_data.items():
+        # Flatten across chunks, and extract the required part. This is a view to
+        # avoid copying the data.
+        output_data[st] = d.reshape(len(timestamps), len(freq))[:, fstart:fend]
 
-    # Extract the required part
-    if freq_start is not None or freq_end is not None:
-        output_data = output_data[:, freq_start:freq_end].copy()
-        freq = freq[freq_start:freq_end]
+    freq = freq[fstart:fend]
 
     return timestamps, freq, output_data
 
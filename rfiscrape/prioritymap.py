@@ -1,7 +1,8 @@
 """A prioritised map like structure."""
 
-import heapq
-from collections.abc import Callable, Hashable
+import itertools
+from collections.abc import Callable, Hashable, Iterable
+from heapq import heapify, heappop, heappush, heappushpop
 from typing import Any
 
 
@@ -17,6 +18,9 @@ PriorityType = int | float | str
 KeyType = Hashable
 ValueType = Any
 
+# Marker for heap entries which have been removed
+_REMOVED = object()
+
 
 class PriorityMap:
     """A key-value map with prioritised item and maximum capacity.
@@ -41,9 +45,44 @@ class PriorityMap:
         self._strict = strict
         self._ignore_existing = ignore_existing
 
-        # Initialise the storage
+        # Initialise the storage. The heap entries are mutable lists of
+        # [priority, key, sequence, value], and `_items` maps each key to its entry.
+        # Removed entries are marked in place and skipped when they reach the top of
+        # the heap. The sequence number ensures a removed entry and a reinserted entry
+        # for the same key never compare their values.
         self._items = {}
         self._priorities = []
+        self._counter = itertools.count()
+        self._nremoved = 0
+
+    @classmethod
+    def from_items(
+        cls,
+        items: Iterable[tuple[KeyType, ValueType, PriorityType | None]],
+        maxlength: int,
+        strict: bool = False,
+        ignore_existing: bool = False,
+    ) -> "PriorityMap":
+        """Create a map from many items at once.
+
+        The heap is built in a single pass. See `extend` for details.
+
+        Parameters
+        ----------
+        items
+            An iterable of (key, value, priority) tuples. If the priority is `None` the
+            key itself is used.
+        maxlength, strict, ignore_existing
+            As for the constructor.
+
+        Returns
+        -------
+        pmap
+            The new map.
+        """
+        pmap = cls(maxlength, strict=strict, ignore_existing=ignore_existing)
+        pmap.extend(items)
+        return pmap
 
     def push(
         self,
@@ -51,7 +90,6 @@ class PriorityMap:
         value: ValueType | None = None,
         priority: PriorityType | None = None,
         call: Callable[[], ValueType] | None = None,
-        _bump: bool = False,
     ) -> None:
         """Add an item to the map.
 
@@ -75,31 +113,72 @@ class PriorityMap:
             If the key currently exists silently return. If not set, an exception will
             be raised.
         """
-        # _bump is an internal argument allowing us to temporarily exceed the size by 1.
+        items = self._items
 
         # Decide what to do if the key exists
-        if key in self:
-            if self._ignore_existing:
-                return
-            raise KeyError(f'Key "{key}" already exists in map.')
+        if key in items and self._check_existing(key):
+            return
 
-        if len(self._items) == (self._maxlength + (1 if _bump else 0)):
+        if len(items) == self._maxlength:
             raise FullContainerError(
                 "Too many items in map. "
-                "Currently {len(self._items)} but maxlength is {self._maxlength}.",
+                f"Currently {len(items)} but maxlength is {self._maxlength}.",
             )
 
-        priority_pair = self._priority_pair(priority, key)
+        entry = self._make_entry(key, value, priority, call)
+        items[key] = entry
+        heappush(self._priorities, entry)
 
-        # Don't do anything in strict mode if the new item would have too low priority
-        if self._strict and self._priorities and priority_pair < self._priorities[0]:
-            raise OutOfOrderError(
-                f"Priority of new item {priority_pair[0]} is lower than "
-                f"the lowest in the map {self._priorities[0]}.",
+    def extend(
+        self, items: Iterable[tuple[KeyType, ValueType, PriorityType | None]]
+    ) -> None:
+        """Add many items to the map at once.
+
+        This rebuilds the heap in a single pass, rather than pushing each item, which
+        is faster when loading many items. Either all the items are added, or if an
+        exception is raised the map is left unchanged.
+
+        Parameters
+        ----------
+        items
+            An iterable of (key, value, priority) tuples. As for `push`, if the priority
+            is `None` the key itself is used.
+        """
+        current = self._items
+        new = {}
+
+        lowest = self.peek() if self._strict and current else None
+
+        for key, value, priority in items:
+            if key in current or key in new:
+                if self._ignore_existing:
+                    continue
+                raise KeyError(f'Key "{key}" already exists in map.')
+
+            priority_pair = self._priority_pair(priority, key)
+
+            # Check the item is not lower than any already added, as if they were pushed
+            # in order
+            if self._strict:
+                if lowest is None:
+                    lowest = priority_pair
+                elif priority_pair < lowest:
+                    raise OutOfOrderError(
+                        f"Priority of new item {priority_pair[0]} is lower than "
+                        f"the lowest in the map {lowest}.",
+                    )
+
+            new[key] = [*priority_pair, next(self._counter), value]
+
+        if len(current) + len(new) > self._maxlength:
+            raise FullContainerError(
+                f"Too many items in map. Adding {len(new)} to the current "
+                f"{len(current)} would exceed maxlength {self._maxlength}.",
             )
 
-        self._items[key] = call() if call else value
-        heapq.heappush(self._priorities, priority_pair)
+        current.update(new)
+        self._priorities.extend(new.values())
+        heapify(self._priorities)
 
     def get(self, key: KeyType) -> ValueType:
         """Get the value corresponding to the key.
@@ -114,7 +193,7 @@ class PriorityMap:
         value
             The corresponding value.
         """
-        return self._items[key]
+        return self._items[key][3]
 
     __getitem__ = get
 
@@ -134,11 +213,39 @@ class PriorityMap:
         key, value
             The key and value for the item.
         """
-        if len(self) == 0:
+        items = self._items
+        if not items:
             raise IndexError("pop called on empty PriorityMap.")
 
-        _, key = heapq.heappop(self._priorities)
-        return key, self._items.pop(key)
+        if self._nremoved:
+            self._prune()
+        _, key, _, value = heappop(self._priorities)
+        del items[key]
+        return key, value
+
+    def remove(self, key: KeyType) -> ValueType:
+        """Remove the item with the given key.
+
+        Parameters
+        ----------
+        key
+            The key of the item to remove.
+
+        Returns
+        -------
+        value
+            The value of the removed item.
+        """
+        entry = self._items.pop(key)
+        value = entry[3]
+
+        # Mark the entry as removed, and compact the heap if too much of it is removed
+        entry[3] = _REMOVED
+        self._nremoved += 1
+        if self._nremoved > len(self._priorities) // 2:
+            self._compact()
+
+        return value
 
     def pushpop(
         self,
@@ -177,22 +284,79 @@ class PriorityMap:
             Returns `None` if the map is not full, otherwise return the lowest key,
             value pair.
         """
-        # We could do a slightly more efficient combined update, but this is much
-        # simpler
-        self.push(key, value=value, priority=priority, call=call, _bump=True)
+        items = self._items
+
+        if len(items) < self._maxlength:
+            self.push(key, value=value, priority=priority, call=call)
+            return None, None
+
+        # If we are full do a combined update with a single heap operation
+        if key in items and self._check_existing(key):
+            return None, None
+
+        if self._nremoved:
+            self._prune()
+        entry = self._make_entry(key, value, priority, call)
+        smallest = heappushpop(self._priorities, entry)
 
-        if len(self) > self._maxlength:
-            return self.pop()
-        return None, None
+        # Only update the items if the new entry was not itself the lowest
+        if smallest is not entry:
+            items[key] = entry
+            del items[smallest[1]]
+
+        return smallest[1], smallest[3]
 
     def peek(self) -> tuple[PriorityType, KeyType]:
         """Return the lowest priority-key pair."""
-        return self._priorities[0]
+        self._prune()
+        return tuple(self._priorities[0][:2])
 
     def full(self) -> bool:
         """Check if the map is full."""
         return len(self) == self._maxlength
 
+    def _check_existing(self, key: KeyType) -> bool:
+        """Check if a key exists, raising an exception unless we should ignore it."""
+        if key in self._items:
+            if self._ignore_existing:
+                return True
+            raise KeyError(f'Key "{key}" already exists in map.')
+        return False
+
+    def _make_entry(
+        self,
+        key: KeyType,
+        value: ValueType | None,
+        priority: PriorityType | None,
+        call: Callable[[], ValueType] | None,
+    ) -> list:
+        """Create a heap entry for a new item, checking the order if needed."""
+        if priority is None:
+            priority = key
+
+        # Don't do anything in strict mode if the new item would have too low priority
+        if self._strict and self._items and (priority, key) < self.peek():
+            raise OutOfOrderError(
+                f"Priority of new item {priority} is lower than "
+                f"the lowest in the map {self.peek()}.",
+            )
+
+        # Build the entry directly rather than via an intermediate priority pair
+        return [priority, key, next(self._counter), call() if call else value]
+
+    def _prune(self) -> None:
+        """Drop any removed entries from the top of the heap."""
+        priorities = self._priorities
+        while priorities and priorities[0][3] is _REMOVED:
+            heappop(priorities)
+            self._nremoved -= 1
+
+    def _compact(self) -> None:
+        """Rebuild the heap without any removed entries."""
+        self._priorities = [e for e in self._priorities if e[3] is not _REMOVED]
+        heapify(self._priorities)
+        self._nremoved = 0
+
     def _priority_pair(
         self, priority: PriorityType | None, key: KeyType
     ) -> tuple[PriorityType | KeyType, KeyType]:
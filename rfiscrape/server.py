@@ -1,5 +1,9 @@
 """HTTP server for accessing RFI stats from the buffer."""
+import asyncio
+import uuid
+from collections.abc import Awaitable, Callable, Mapping
 from io import BytesIO
+from typing import Any
 
 import h5py
 import numpy as np
@@ -7,6 +11,20 @@ from aiohttp import web
 
 from . import config, db, util
 
+# Use the faster orjson library for JSON responses if it is available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The minimum size of the data in HDF5 responses to compress, and the target chunk size
+# when doing so
+H5_COMPRESS_BYTES = 2**16
+H5_CHUNK_BYTES = 2**18
+
+# The size of the pieces to write streamed responses in
+STREAM_CHUNK_BYTES = 2**20
+
 
 def _rfidata_to_json(time: np.ndarray, freq: np.ndarray, data: np.ndarray) -> dict:
     return {
@@ -16,43 +34,94 @@ def _rfidata_to_json(time: np.ndarray, freq: np.ndarray, data: np.ndarray) -> di
     }
 
 
-def _rfidata_to_numpy_bytes(
+def _json_response(d: dict) -> web.Response:
+    """Create a JSON response, using orjson to serialise it if available."""
+    if orjson is None:
+        return web.json_response(d)
+
+    return web.Response(
+        body=orjson.dumps(d), content_type="application/json", charset="utf-8"
+    )
+
+
+def _rfidata_to_json_response(
     time: np.ndarray, freq: np.ndarray, data: np.ndarray
-) -> dict:
-    with BytesIO() as f:
-        np.savez(f, time=time, freq=freq, data=data)
-        return f.getvalue()
+) -> web.Response:
+    return _json_response(_rfidata_to_json(time, freq, data))
 
 
-def _rfidata_to_h5py_bytes(
+def _rfidata_to_binary_buffers(
     time: np.ndarray, freq: np.ndarray, data: np.ndarray
-) -> dict:
-    with BytesIO() as f:
-        with h5py.File(f, mode="w") as fh:
-            fh.create_dataset("index_map/time", data=time)
-            fh.create_dataset("index_map/freq", data=freq)
-            ds = fh.create_dataset("rfi", data=data)
-            ds.attrs["axis"] = ["time", "freq"]
-        return f.getvalue()
+) -> list[bytes | memoryview]:
+    return util.pack_arrays_buffers({"time": time, "freq": freq, "data": data})
 
 
-async def get_rfi(request: web.Request) -> web.Response:
-    """Handler for RFI data requests."""
-    query_uri = request.query
-    query_json = await request.json() if request.body_exists else None
+def _rfidata_to_numpy_buffers(
+    time: np.ndarray, freq: np.ndarray, data: np.ndarray
+) -> list[memoryview]:
+    # Return a view of the buffer rather than copying out its value
+    f = BytesIO()
+    np.savez(f, time=time, freq=freq, data=data)
+    return [f.getbuffer()]
 
-    if query_uri and query_json:
-        raise web.HTTPBadRequest(
-            reason="Use either a query string, or a JSON body, not both.",
-        )
 
-    query = query_uri or query_json
+def _rfidata_to_h5py_bytes(
+    time: np.ndarray, freq: np.ndarray, data: np.ndarray
+) -> bytes:
+    # Only compress responses large enough for it to be worthwhile
+    if data.nbytes >= H5_COMPRESS_BYTES:
+        ds_args = util.hdf5_compression_args(data, H5_CHUNK_BYTES)
+    else:
+        ds_args = {}
+
+    # Build the file entirely in memory with the core driver, and take its image at the
+    # end. The name only needs to be unique among the currently open files.
+    with h5py.File(
+        f"rfi-{uuid.uuid4().hex}.h5", mode="w", driver="core", backing_store=False
+    ) as fh:
+        fh.create_dataset("index_map/time", data=time)
+        fh.create_dataset("index_map/freq", data=freq)
+        ds = fh.create_dataset("rfi", data=data, **ds_args)
+        ds.attrs["axis"] = ["time", "freq"]
+        fh.flush()
+        return fh.id.get_file_image()
+
+
+async def _stream_buffers(
+    request: web.Request,
+    buffers: list[bytes | memoryview],
+    headers: dict[str, str],
+    compress: bool = True,
+) -> web.StreamResponse:
+    """Write out the buffers as the response body without joining them.
+
+    If `compress` is set, the body is compressed if the client accepts it.
+    """
+    r = web.StreamResponse(headers=headers)
+    r.content_length = sum(memoryview(b).nbytes for b in buffers)
+    if compress:
+        r.enable_compression()
+    await r.prepare(request)
+
+    for buf in buffers:
+        view = memoryview(buf)
+        for start in range(0, view.nbytes, STREAM_CHUNK_BYTES):
+            await r.write(view[start : start + STREAM_CHUNK_BYTES])
+
+    await r.write_eof()
+    return r
 
-    if not query:
-        raise web.HTTPBadRequest(
-            reason="Supply a query, either as a string, or a JSON body.",
-        )
 
+def _parse_query(
+    query: Mapping[str, Any],
+) -> tuple[float, float, int | None, int | None, db.SpectrumType]:
+    """Get the time range, frequency range and spectrum type from a query.
+
+    Raises
+    ------
+    web.HTTPBadRequest
+        If any of the parameters are missing or invalid.
+    """
     try:
         start_time = util.convert_unix(query["start_time"])
         end_time = util.convert_unix(query["end_time"])
@@ -63,7 +132,11 @@ async def get_rfi(request: web.Request) -> web.Response:
 
     freq_start = query.get("freq_start", None)
     freq_end = query.get("freq_end", None)
-    type_ = query.get("type", "json")
+    try:
+        freq_start = int(freq_start) if freq_start is not None else None
+        freq_end = int(freq_end) if freq_end is not None else None
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason="Frequency range must be integers.") from e
 
     spec_type = query.get("spectrum_type", "STAGE_1")
     try:
@@ -71,6 +144,29 @@ async def get_rfi(request: web.Request) -> web.Response:
     except KeyError as e:
         raise web.HTTPBadRequest(reason=f"Unknown spectrum type {spec_type=}.") from e
 
+    return start_time, end_time, freq_start, freq_end, spec_type
+
+
+async def get_rfi(request: web.Request) -> web.StreamResponse:
+    """Handler for RFI data requests."""
+    query_uri = request.query
+    query_json = await request.json() if request.body_exists else None
+
+    if query_uri and query_json:
+        raise web.HTTPBadRequest(
+            reason="Use either a query string, or a JSON body, not both.",
+        )
+
+    query = query_uri or query_json
+
+    if not query:
+        raise web.HTTPBadRequest(
+            reason="Supply a query, either as a string, or a JSON body.",
+        )
+
+    start_time, end_time, freq_start, freq_end, spec_type = _parse_query(query)
+    type_ = query.get("type", "json")
+
     rfi_data = db.fetch_rfi(
         start_time,
         end_time,
@@ -79,20 +175,40 @@ async def get_rfi(request: web.Request) -> web.Response:
         freq_end,
     )
 
+    # Run the serialisation in the default executor so it doesn't block the event loop
+    def _serialise(func: Callable) -> Awaitable:
+        return asyncio.get_running_loop().run_in_executor(None, func, *rfi_data)
+
     match type_:
         case "json":
-            d = _rfidata_to_json(*rfi_data)
-            r = web.json_response(d)
+            r = await _serialise(_rfidata_to_json_response)
+            r.enable_compression()
+        case "binary":
+            r = await _stream_buffers(
+                request,
+                await _serialise(_rfidata_to_binary_buffers),
+                {"Content-Type": "application/octet-stream"},
+            )
         case "numpy":
-            r = web.Response()
-            r.headers["Content-Disposition"] = "Attachment;filename=rfi.npz"
-            r.headers["Content-Type"] = "application/x-python"
-            r.body = _rfidata_to_numpy_bytes(*rfi_data)
+            r = await _stream_buffers(
+                request,
+                await _serialise(_rfidata_to_numpy_buffers),
+                {
+                    "Content-Disposition": "Attachment;filename=rfi.npz",
+                    "Content-Type": "application/x-python",
+                },
+            )
         case "hdf5":
-            r = web.Response()
-            r.headers["Content-Disposition"] = "Attachment;filename=rfi.h5"
-            r.headers["Content-Type"] = "application/x-hdf5"
-            r.body = _rfidata_to_h5py_bytes(*rfi_data)
+            r = await _stream_buffers(
+                request,
+                [await _serialise(_rfidata_to_h5py_bytes)],
+                {
+                    "Content-Disposition": "Attachment;filename=rfi.h5",
+                    "Content-Type": "application/x-hdf5",
+                },
+                # Large datasets are already compressed within the file
+                compress=False,
+            )
         case _:
             raise web.HTTPBadRequest(reason=f"Unknown type {type_}.")
 
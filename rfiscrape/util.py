@@ -1,12 +1,20 @@
 """Utilities functions."""
 
-import base64
 import binascii
 import datetime
+import functools
+import json
+import struct
 
 import dateutil.parser
 import numpy as np
 
+# Use the SIMD accelerated base64 implementation if it is available
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
 
 def naive_to_utc(dt: datetime.datetime) -> datetime.datetime:
     """Ensure a datetime has a valid timezone by setting naive datetimes to UTC."""
@@ -31,28 +39,60 @@ def convert_unix(t: float | str) -> float:
         s is invalid type for date
     """
     if isinstance(t, str):
-        # First check to see if this is just a UNIX timestamp as a string
-        try:
-            return float(t)
-        except ValueError:
-            pass
+        # Strings missing a date are resolved relative to the current one, so include
+        # that in the cache key. This is the local date to match dateutil's default
+        return _convert_unix_str(t, datetime.date.today())  # noqa: DTZ011
+    return float(t)
+
+
+@functools.lru_cache(maxsize=1024)
+def _convert_unix_str(t: str, today: datetime.date) -> float:  # noqa: ARG001
+    """Convert a string timestamp. This is cached as parsing is expensive."""
+    # First check to see if this is just a UNIX timestamp as a string
+    try:
+        return float(t)
+    except ValueError:
+        pass
 
-        # If note, hopefully it's a timestamp
+    # If not, hopefully it's a timestamp. Try the much faster stdlib ISO 8601 parser
+    # first, and only use dateutil for anything else
+    try:
+        dt = datetime.datetime.fromisoformat(t.replace("Z", "+00:00"))
+    except ValueError:
         try:
             dt = dateutil.parser.parse(t)
-        except dateutil.parser.ParseError as e:
+        except (dateutil.parser.ParserError, OverflowError) as e:
             raise RuntimeError("Could not parse the passed datetime string.") from e
 
-        return naive_to_utc(dt).timestamp()
-    return float(t)
+    return naive_to_utc(dt).timestamp()
+
+
+def hdf5_compression_args(data: np.ndarray, chunk_bytes: int = 2**20) -> dict:
+    """Get the chunking and compression args for a (time, freq) dataset.
+
+    The chunks span the full frequency axis and are roughly `chunk_bytes` in size. We
+    use the builtin LZF filter with shuffling so the files remain readable without
+    any extra HDF5 plugins.
+    """
+    # HDF5 can't chunk an empty dataset
+    if data.size == 0:
+        return {}
+
+    ntime, nfreq = data.shape
+    nt = min(ntime, max(1, chunk_bytes // (nfreq * data.dtype.itemsize)))
+
+    return {"chunks": (nt, nfreq), "compression": "lzf", "shuffle": True}
 
 
 def numpy_to_json(arr: np.ndarray) -> dict:
     """Take an array and return as a dict that can be json serialised."""
+    # Encode straight from a flat byte view of the array, this only copies if the array
+    # is not already contiguous and little-endian
+    header, buf = numpy_to_bytes(arr)
     return {
-        "dtype": str(arr.dtype),
-        "shape": list(arr.shape),
-        "data": base64.b64encode(arr).decode("utf8"),
+        "dtype": str(np.dtype(header["dtype"])),
+        "shape": header["shape"],
+        "data": base64.b64encode(buf).decode("utf8"),
     }
 
 
@@ -80,3 +120,86 @@ def json_to_numpy(jdict: dict) -> np.ndarray:
         ) from e
 
     return arr
+
+
+def numpy_to_bytes(arr: np.ndarray) -> tuple[dict, memoryview]:
+    """Get a header describing an array and a view of its raw little-endian bytes.
+
+    The data is only copied if the array is not contiguous or not little-endian.
+    """
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+    header = {"dtype": arr.dtype.str, "shape": list(arr.shape)}
+    return header, memoryview(arr.reshape(-1).view(np.uint8))
+
+
+def bytes_to_numpy(header: dict, data: bytes | memoryview) -> np.ndarray:
+    """Decode an array from a header and raw bytes from `numpy_to_bytes`."""
+    try:
+        dtype = np.dtype(header["dtype"])
+        shape = header["shape"]
+    except KeyError as e:
+        raise RuntimeError("Header does not represent a numpy array.") from e
+
+    try:
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+    except ValueError as e:
+        raise RuntimeError(
+            f"Could not decode data into an array of dtype {dtype} and shape {shape}",
+        ) from e
+
+
+_length_format = "<I"
+
+
+def pack_arrays(arrays: dict[str, np.ndarray]) -> bytes:
+    """Pack a set of named arrays into a single binary message.
+
+    The message is a little-endian uint32 giving the length of a UTF-8 JSON header,
+    the header itself, and then the raw bytes of each array in order. The header
+    maps each name to the `dtype` and `shape` of the array, and its `nbytes`.
+    """
+    return b"".join(pack_arrays_buffers(arrays))
+
+
+def pack_arrays_buffers(arrays: dict[str, np.ndarray]) -> list[bytes | memoryview]:
+    """Get the message from `pack_arrays` as a list of buffers without joining them.
+
+    The array buffers are views of the arrays where possible, so this avoids copying
+    the data if it is written out piece by piece.
+    """
+    headers = {}
+    buffers = []
+
+    for name, arr in arrays.items():
+        header, buf = numpy_to_bytes(arr)
+        header["nbytes"] = buf.nbytes
+        headers[name] = header
+        buffers.append(buf)
+
+    header_bytes = json.dumps(headers).encode("utf8")
+
+    return [struct.pack(_length_format, len(header_bytes)), header_bytes, *buffers]
+
+
+def unpack_arrays(buf: bytes) -> dict[str, np.ndarray]:
+    """Unpack the named arrays from a message created by `pack_arrays`."""
+    buf = memoryview(buf)
+
+    try:
+        (hlen,) = struct.unpack_from(_length_format, buf)
+        offset = struct.calcsize(_length_format)
+        headers = json.loads(bytes(buf[offset : offset + hlen]))
+    except (struct.error, ValueError) as e:
+        raise RuntimeError("Could not decode the message header.") from e
+
+    offset += hlen
+    arrays = {}
+
+    for name, header in headers.items():
+        nbytes = header.get("nbytes", 0)
+        if offset + nbytes > len(buf):
+            raise RuntimeError("Message is too short for the described arrays.")
+        arrays[name] = bytes_to_numpy(header, buf[offset : offset + nbytes])
+        offset += nbytes
+
+    return arrays
@@ -0,0 +1,78 @@
+"""Test scraping the RFI metrics in the client."""
+
+import numpy as np
+
+from rfiscrape import client
+
+METRICS = b"""\
+# HELP kotekan_rfibroadcast_sample_total Total samples.
+# TYPE kotekan_rfibroadcast_sample_total counter
+kotekan_rfibroadcast_sample_total{freq_id="7"} 100
+kotekan_rfibroadcast_sample_total{freq_id="3"} 200
+kotekan_rfibroadcast_dropped_sample_total{freq_id="7"} 10
+kotekan_rfibroadcast_dropped_sample_total{freq_id="3"} 20
+kotekan_rfiframedrop_total_frame_total{freq_id="7"} 30
+kotekan_rfiframedrop_dropped_frame_total{freq_id="7"} 3
+kotekan_rfiframedrop_total_frame_total{host="gpu-1",stream="4",freq_id="3"} 40
+kotekan_rfiframedrop_dropped_frame_total{host="gpu-1",stream="4",freq_id="3"} 4
+kotekan_rfibroadcast_weird_sample_total{freq_id="11"} 5
+kotekan_rfiframedrop_dropped_frame_total{freq_id="12"} 6
+kotekan_other_sample_total{freq_id="13"} 7
+"""
+
+
+class _Response:
+    def __init__(self, content: bytes):
+        self.content = content
+
+
+class _Session:
+    """A stand in for `requests.Session` which returns fixed metrics."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.urls = []
+
+    def get(self, url: str, timeout: float) -> _Response:
+        self.urls.append(url)
+        return _Response(self.content)
+
+
+def test_scrape():
+    """Test extracting the counts from the metrics."""
+    session = _Session(METRICS)
+
+    s = client.scrape(session, "localhost:12048", timeout=1.0)
+
+    assert session.urls == ["http://localhost:12048/metrics"]
+    assert isinstance(s["time"], float)
+
+    # Unknown types still produce an entry for their frequency, but other metrics are
+    # ignored
+    assert s["freq"] == [3, 7, 11, 12]
+
+    # Metrics without a type are totals, and missing entries are -1
+    expected = np.array(
+        [
+            [[200, 100, -1, -1], [20, 10, -1, -1]],
+            [[40, 30, -1, -1], [4, 3, -1, 6]],
+        ]
+    )
+    assert len(s["data"]) == expected.size
+    np.testing.assert_array_equal(np.array(s["data"]).reshape(2, 2, -1), expected)
+
+
+def test_scrape_empty():
+    """Test scraping a target without any RFI metrics."""
+    s = client.scrape(_Session(b"# No metrics\n"), "localhost:12048", timeout=1.0)
+
+    assert s["freq"] == []
+    assert len(s["data"]) == 0
+
+
+def test_scrape_pack():
+    """Test that a scraped sample can be packed for sending."""
+    s = client.scrape(_Session(METRICS), "localhost:12048", timeout=1.0)
+    s["completion_time"] = s["time"]
+
+    assert len(client.pack(s)) == 20 + (4 + 32) * len(s["freq"])
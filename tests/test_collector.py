@@ -0,0 +1,334 @@
+"""Test the message handling and assembly in the collector."""
+
+import array
+import asyncio
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from rfiscrape import client, collector, db
+
+
+@pytest.fixture()
+def sample():
+    """A scraped sample with every count distinct."""
+    nfreq = 5
+    return {
+        "time": 1700000000.25,
+        "completion_time": 1700000000.5,
+        "freq": [3, 17, 100, 512, 1023],
+        "data": array.array("q", range(-1, 4 * nfreq - 1)),
+    }
+
+
+def test_roundtrip(sample: dict):
+    """Test that a packed message decodes to the original sample."""
+    msg = collector.decode_message(client.pack(sample))
+
+    assert msg["time"] == sample["time"]
+    assert msg["completion_time"] == sample["completion_time"]
+    np.testing.assert_array_equal(msg["freq"], sample["freq"])
+
+    assert msg["data"].shape == (2, 2, len(sample["freq"]))
+    np.testing.assert_array_equal(
+        msg["data"], np.array(sample["data"]).reshape(2, 2, -1)
+    )
+
+
+def test_empty():
+    """Test a message with no frequencies."""
+    s = {"time": 1.0, "completion_time": 2.0, "freq": [], "data": []}
+
+    msg = collector.decode_message(client.pack(s))
+
+    assert msg["freq"].shape == (0,)
+    assert msg["data"].shape == (2, 2, 0)
+
+
+def test_malformed(sample: dict):
+    """Test that truncated, over-long and header-only messages are rejected."""
+    buf = client.pack(sample)
+    header_size = struct.calcsize(client.header_format)
+
+    for bad in [buf[:-1], buf + b"\0", buf[:header_size], buf[: header_size - 1], b""]:
+        with pytest.raises(ValueError, match="Could not decode"):
+            collector.decode_message(bad)
+
+
+def test_freq_range(sample: dict):
+    """Test that frequency ids beyond the collected range are rejected."""
+    collector.decode_message(client.pack(sample), nfreq=1024)
+
+    with pytest.raises(ValueError, match="out of range"):
+        collector.decode_message(client.pack(sample), nfreq=1023)
+
+    sample["freq"][-1] = 2000
+    with pytest.raises(ValueError, match="out of range"):
+        collector.decode_message(client.pack(sample))
+
+    sample["time"] = float("nan")
+    with pytest.raises(ValueError, match="time"):
+        collector.decode_message(client.pack(sample))
+
+
+def test_validate_json():
+    """Test converting and rejecting the JSON messages from older clients."""
+    body = {"time": 10, "freq": [1, 2], "data": [[[1, 2], [0, 1]], [[3, 4], [1, 0]]]}
+
+    msg = collector.validate_message(body)
+    assert msg["time"] == 10.0
+    np.testing.assert_array_equal(msg["freq"], [1, 2])
+    np.testing.assert_array_equal(msg["data"], body["data"])
+
+    bad_bodies = [
+        {"freq": [1], "data": [[[1], [0]], [[1], [0]]]},
+        {**body, "time": "soon"},
+        {**body, "freq": [1, "a"]},
+        {**body, "freq": [1, 2, 3]},
+        {**body, "data": [1, 2, 3, 4]},
+        {**body, "freq": [1, 2000]},
+        {**body, "freq": [-1, 2]},
+        [body],
+        None,
+    ]
+    for bad in bad_bodies:
+        with pytest.raises(ValueError):
+            collector.validate_message(bad)
+
+
+async def _post(**kwargs: object) -> int:
+    """Post a message to the collector and return the response status."""
+    app = web.Application()
+    app.add_routes([web.post("/rfi", collector.receive_rfi)])
+
+    async with TestClient(TestServer(app)) as c:
+        r = await c.post("/rfi", **kwargs)
+        return r.status
+
+
+def _drain_assemble_queue() -> list:
+    """Remove and return everything waiting for the assembler."""
+    items = []
+    while not collector.assemble_queue.empty():
+        items.append(collector.assemble_queue.get_nowait())
+    return items
+
+
+def test_receive_invalid():
+    """Test that invalid messages are rejected without reaching the assembler."""
+    body = {"freq": [1], "data": [[[1], [0]], [[1], [0]]]}
+
+    assert asyncio.run(_post(json=body)) == 400
+    assert _drain_assemble_queue() == []
+
+    body["time"] = 10.0
+    assert asyncio.run(_post(json=body)) == 200
+    assert len(_drain_assemble_queue()) == 1
+
+    # Bodies which aren't valid JSON
+    headers = {"Content-Type": "application/json"}
+    assert asyncio.run(_post(data=b"{not json", headers=headers)) == 400
+
+    # Binary messages with a frequency outside the collected range
+    s = {"time": 1.0, "completion_time": 2.0, "freq": [2000], "data": [1, 0, 1, 0]}
+    assert asyncio.run(_post(data=client.pack(s))) == 400
+    assert _drain_assemble_queue() == []
+
+
+def _run_assembler(messages: list, window: int, nfreq: int) -> list:
+    """Run the assembler over the messages and return the samples it sends on."""
+    for m in [*messages, None]:
+        collector.assemble_queue.put_nowait(m)
+
+    # Stand in for the writer thread so the assembler can shut down
+    written = []
+
+    def _consume() -> None:
+        while True:
+            item = collector.write_queue.get()
+            collector.write_queue.task_done()
+            if item is None:
+                return
+            written.append((item.timestamp, item.data.copy()))
+
+    consumer = threading.Thread(target=_consume)
+    consumer.start()
+    asyncio.run(collector.assembler(window, nfreq))
+    consumer.join()
+
+    return sorted(written, key=lambda x: x[0])
+
+
+def test_assembler_bad_message():
+    """Test that a bad message doesn't stop the assembler."""
+    counts = np.arange(8).reshape(2, 2, 2)
+    messages = [
+        {"time": 1.0, "freq": np.array([0, 1]), "data": counts},
+        {"freq": np.array([0]), "data": counts[..., :1]},
+        {"time": 1.0, "freq": np.array([2]), "data": counts[..., :1]},
+        {"time": 2.0, "freq": np.array([7]), "data": counts[..., 1:]},
+        {"time": 2.0, "freq": np.array([3]), "data": counts[..., 1:]},
+    ]
+
+    written = _run_assembler(messages, window=4, nfreq=4)
+
+    assert [t for t, _ in written] == [1.0, 2.0]
+    np.testing.assert_array_equal(
+        written[0][1][..., :3], np.dstack([counts, counts[..., :1]])
+    )
+    assert np.isnan(written[0][1][..., 3]).all()
+    np.testing.assert_array_equal(written[1][1][..., 3], counts[..., 1])
+
+
+def test_pool_reuse():
+    """Test that released buffers are reset and reused."""
+    pool = collector.AssembledDataPool()
+
+    a = pool.acquire(1.0, 4)
+    a.data[:] = 1.0
+    pool.release(a)
+
+    b = pool.acquire(2.0, 4)
+    assert b is a
+    assert b.timestamp == 2.0
+    assert np.isnan(b.data).all()
+
+    # Buffers of the wrong size are discarded
+    pool.release(b)
+    c = pool.acquire(3.0, 8)
+    assert c is not b
+    assert c.data.shape == (2, 2, 8)
+    assert pool.acquire(4.0, 4) is not b
+
+
+def _drain_write_queue() -> list:
+    """Remove and return everything waiting for the writer."""
+    items = []
+    while not collector.write_queue.empty():
+        items.append(collector.write_queue.get_nowait())
+        collector.write_queue.task_done()
+    return items
+
+
+def test_put_drop_oldest():
+    """Test that a full write queue drops its oldest sample."""
+    entries = [
+        collector.data_pool.acquire(float(t), 4)
+        for t in range(collector.MAX_WRITE_QUEUE + 1)
+    ]
+
+    for e in entries:
+        collector._put_drop_oldest(e)
+
+    # The dropped sample must be marked done, and returned to the pool for reuse
+    assert collector.write_queue.unfinished_tasks == collector.MAX_WRITE_QUEUE
+    assert collector.data_pool.acquire(100.0, 4) is entries[0]
+
+    assert _drain_write_queue() == entries[1:]
+    assert collector.write_queue.unfinished_tasks == 0
+
+
+def _sample(
+    timestamp: float, total: float, dropped: np.ndarray
+) -> collector.AssembledData:
+    """Create an assembled sample with equal totals and the given dropped counts."""
+    entry = collector.data_pool.acquire(timestamp, dropped.shape[-1])
+    entry.total[:] = total
+    entry.dropped[:] = dropped
+    return entry
+
+
+def _read_buffer(path: Path) -> list[tuple[float, int, np.ndarray]]:
+    """Read the rows in the buffer directly, independently of the writer."""
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute(
+            "SELECT timestamp, spectrum_type, encoding_type, data FROM rfidata "
+            "ORDER BY timestamp, spectrum_type"
+        ).fetchall()
+
+    return [
+        (t, st, db.decode(db.SpectrumType(st), db.EncodingType(enc), d))
+        for t, st, enc, d in rows
+    ]
+
+
+def _start_writer(path: Path, **kwargs: float) -> threading.Thread:
+    """Run the writer on the buffer in a thread, without purging any samples."""
+    thread = threading.Thread(
+        target=collector.writer,
+        args=(str(path), 1e9, 1e9),
+        kwargs=kwargs,
+    )
+    thread.start()
+    return thread
+
+
+def _wait_for_rows(path: Path, nrows: int, timeout: float = 5.0) -> list:
+    """Wait until the buffer has the given number of rows."""
+    start = time.time()
+    while time.time() - start < timeout:
+        # The writer may not have created the table yet
+        try:
+            if path.exists() and len(rows := _read_buffer(path)) >= nrows:
+                return rows
+        except sqlite3.OperationalError:
+            pass
+        time.sleep(0.02)
+    return _read_buffer(path)
+
+
+def test_writer_batches(tmp_path: Path):
+    """Test that the writer inserts in batches, and writes out the rest at the end."""
+    path = tmp_path / "buffer.db"
+    thread = _start_writer(path, batch_size=2, flush_interval=1e3)
+
+    now = time.time()
+    dropped = np.array([[0.0, 1.0, 2.0, 3.0], [0.0, 0.0, 4.0, 4.0]])
+    for ii in range(4):
+        collector.write_queue.put(_sample(now + ii, 4.0 * ii, dropped * ii))
+
+    # The first sample is only a reference for the differences, so this is the first
+    # full batch of two samples
+    rows = _wait_for_rows(path, 4)
+    assert len(rows) == 4
+
+    # The remaining sample is written out when the writer is shut down
+    collector.write_queue.put(None)
+    thread.join(timeout=5.0)
+    assert not thread.is_alive()
+    assert collector.write_queue.unfinished_tasks == 0
+
+    rows = _read_buffer(path)
+    assert [(t, st) for t, st, _ in rows] == [
+        (now + t, st.value)
+        for t in [1, 2, 3]
+        for st in [db.SpectrumType.STAGE_1, db.SpectrumType.STAGE_2]
+    ]
+    for _, st, frac in rows:
+        np.testing.assert_allclose(
+            frac, dropped[st - 1] / 4.0, atol=1.0 / db.U16_FRAC_MAX
+        )
+
+
+def test_writer_timeout(tmp_path: Path):
+    """Test that the writer writes pending rows if no more samples arrive."""
+    path = tmp_path / "buffer.db"
+    thread = _start_writer(path, batch_size=100, flush_interval=0.1)
+
+    now = time.time()
+    dropped = np.zeros((2, 4))
+    collector.write_queue.put(_sample(now, 0.0, dropped))
+    collector.write_queue.put(_sample(now + 1, 1.0, dropped))
+
+    assert len(_wait_for_rows(path, 2)) == 2
+
+    collector.write_queue.put(None)
+    thread.join(timeout=5.0)
+    assert not thread.is_alive()
@@ -0,0 +1,105 @@
+"""Test the config resolution."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rfiscrape import config
+
+
+def test_flatten():
+    """Test flattening nested dictionaries."""
+    d = {"a": 1, "b": {"c": 2, "d": {"e": 3}}, "f": [4, 5]}
+
+    flat = config._flatten_dict(d)
+
+    assert flat == {"a": 1, "b.c": 2, "b.d.e": 3, "f": [4, 5]}
+    assert list(flat) == ["a", "b.c", "b.d.e", "f"]
+
+    assert config._flatten_dict(d, sep="/") == {
+        "a": 1,
+        "b/c": 2,
+        "b/d/e": 3,
+        "f": [4, 5],
+    }
+
+
+def test_flatten_empty():
+    """Test that empty nested dictionaries are preserved."""
+    assert config._flatten_dict({}) == {}
+    assert config._flatten_dict({"a": {}, "b": {"c": {}, "d": 1}}) == {
+        "a": {},
+        "b.c": {},
+        "b.d": 1,
+    }
+
+
+def test_flatten_invalid():
+    """Test that invalid keys are rejected."""
+    with pytest.raises(TypeError):
+        config._flatten_dict({"a": {1: 2}})
+
+    with pytest.raises(ValueError, match="separator"):
+        config._flatten_dict({"a": {"b.c": 2}})
+
+
+def test_filter_sections():
+    """Test extracting sections from a flattened dictionary."""
+    flat = config._flatten_dict(
+        {"a": {"x": 1, "y": {"z": 2}}, "b": {"x": 3}, "ab": {"x": 4}, "w": 5}
+    )
+
+    assert config._filter_sections(flat, None) == flat
+    assert config._filter_sections(flat, ["a"]) == {"x": 1, "y.z": 2}
+    assert config._filter_sections(flat, ["a", "b"]) == {"x": 3, "y.z": 2}
+    assert config._filter_sections(flat, ["c"]) == {}
+
+
+def test_resolve():
+    """Test the precedence of the config sources."""
+    params = config._flatten_dict(config._get_sections(config.schema, ["collector"]))
+
+    file_config = [{"port": 1234, "window": 10}, {"port": 4321, "time": 50}]
+    cli_args = {"window": "7", "time": None}
+
+    conf = config.resolve_config(params, cli_args, file_config)
+
+    assert conf["port"] == 1234
+    assert conf["window"] == 7
+    assert conf["time"] == 50
+    assert conf["purge"] == params["purge"].default
+
+
+def test_relative_config_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that a relative config file is found from the current directory."""
+    for d, port in [("a", 1), ("b", 2)]:
+        (tmp_path / d).mkdir()
+        (tmp_path / d / "test.conf").write_text(f"port: {port}\n")
+
+    name = "rfiscrape-test-relative"
+
+    monkeypatch.chdir(tmp_path / "a")
+    assert config.load_standard_config_files(name, "test.conf") == [{"port": 1}]
+
+    monkeypatch.chdir(tmp_path / "b")
+    assert config.load_standard_config_files(name, "test.conf") == [{"port": 2}]
+
+
+def test_reload_changed_file(tmp_path: Path):
+    """Test that config files are only reparsed once they have been modified."""
+    path = tmp_path / "test.conf"
+    path.write_text("port: 1\n")
+    name = "rfiscrape-test-reload"
+
+    assert config.load_standard_config_files(name, str(path)) == [{"port": 1}]
+    hits = config._load_file.cache_info().hits
+    assert config.load_standard_config_files(name, str(path)) == [{"port": 1}]
+    assert config._load_file.cache_info().hits == hits + 1
+
+    # Give the edited file a distinct modification time
+    mtime = path.stat().st_mtime_ns
+    path.write_text("port: 2\n")
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+    assert config.load_standard_config_files(name, str(path)) == [{"port": 2}]
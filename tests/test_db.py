@@ -0,0 +1,149 @@
+"""Test the encoding of the buffer data."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from rfiscrape import db
+
+
+def test_raw():
+    """Test that the raw encoding round trips exactly."""
+    data = np.array([0.0, 0.25, 1.0, np.nan, -1.0], dtype=np.float32)
+
+    enc = db.encode(db.SpectrumType.STAGE_1, db.EncodingType.RAW, data)
+    dec = db.decode(db.SpectrumType.STAGE_1, db.EncodingType.RAW, enc)
+
+    np.testing.assert_array_equal(dec, data)
+
+
+def test_u16_frac():
+    """Test the quantised fraction encoding."""
+    data = np.array([0.0, 0.25, 1.0, np.nan, -1.0, 2.0, 1e-3], dtype=np.float32)
+
+    enc = db.encode(db.SpectrumType.STAGE_2, db.EncodingType.U16_FRAC, data)
+    assert len(enc) == 2 * len(data)
+
+    dec = db.decode(db.SpectrumType.STAGE_2, db.EncodingType.U16_FRAC, enc)
+
+    assert dec.dtype == np.float32
+    np.testing.assert_allclose(dec, np.clip(data, 0.0, 1.0), atol=1.0 / db.U16_FRAC_MAX)
+    assert np.isnan(dec[3])
+
+
+def test_unknown():
+    """Test that unsupported encodings raise."""
+    with pytest.raises(ValueError, match="Cannot decode"):
+        db.decode(db.SpectrumType.STAGE_1, db.EncodingType.LOG_BITSHUFFLE, b"")
+
+
+def test_decode_many():
+    """Test decoding several blobs at once."""
+    data = np.random.default_rng(0).uniform(size=(3, 8)).astype(np.float32)
+
+    for enc in [db.EncodingType.RAW, db.EncodingType.U16_FRAC]:
+        blobs = [db.encode(db.SpectrumType.STAGE_1, enc, d) for d in data]
+        dec = db.decode_many(db.SpectrumType.STAGE_1, enc, blobs, 8)
+
+        assert dec.shape == (3, 8)
+        for d, b in zip(dec, blobs):
+            np.testing.assert_array_equal(d, db.decode(db.SpectrumType.STAGE_1, enc, b))
+
+    with pytest.raises(ValueError, match="inconsistent"):
+        db.decode_many(db.SpectrumType.STAGE_1, enc, [blobs[0], blobs[1][:-2]], 8)
+
+
+@pytest.fixture()
+def buffer_db(tmp_path: Path):
+    """A buffer db with a mix of encodings, spectrum types and frequency chunks."""
+    db.connect(str(tmp_path / "buffer.db"), readonly=False)
+
+    rng = np.random.default_rng(12345)
+    chunksize = 1024
+    s1 = db.SpectrumType.STAGE_1
+    s2 = db.SpectrumType.STAGE_2
+
+    # The expected data for times 10, 11, 12 across two frequency chunks
+    expected = {st: np.full((3, 2 * chunksize), np.nan, np.float32) for st in [s1, s2]}
+    rows = []
+
+    def _add(ti: int, chunk: int, st: db.SpectrumType, enc: db.EncodingType):
+        data = rng.uniform(size=chunksize).astype(np.float32)
+        blob = db.encode(st, enc, data)
+        expected[st][ti, chunk * chunksize : (chunk + 1) * chunksize] = db.decode(
+            st, enc, blob
+        )
+        rows.append((10.0 + ti, chunk, st.value, enc.value, blob))
+
+    _add(0, 0, s1, db.EncodingType.RAW)
+    _add(0, 1, s1, db.EncodingType.U16_FRAC)
+    _add(1, 0, s1, db.EncodingType.U16_FRAC)
+    _add(1, 0, s2, db.EncodingType.RAW)
+    _add(2, 1, s2, db.EncodingType.U16_FRAC)
+    db.insert_rfi(rows)
+
+    yield expected
+
+    db.close()
+
+
+def test_fetch(buffer_db: dict):
+    """Test fetching several spectrum types stored with mixed encodings."""
+    s1 = db.SpectrumType.STAGE_1
+    s2 = db.SpectrumType.STAGE_2
+
+    times, freq, data = db.fetch_rfi_multi(0, 100, [s1, s2])
+
+    np.testing.assert_array_equal(times, [10.0, 11.0, 12.0])
+    np.testing.assert_array_equal(freq, np.arange(2048))
+    for st in [s1, s2]:
+        np.testing.assert_array_equal(data[st], buffer_db[st])
+
+    # A single type only finds the times it has data for
+    times, freq, data = db.fetch_rfi(0, 100, s2)
+    np.testing.assert_array_equal(times, [11.0, 12.0])
+    np.testing.assert_array_equal(data, buffer_db[s2][1:])
+
+
+def test_fetch_subrange(buffer_db: dict):
+    """Test fetching a frequency range within and across chunks."""
+    s1 = db.SpectrumType.STAGE_1
+
+    times, freq, data = db.fetch_rfi(0, 100, s1, 1000, 1100)
+    np.testing.assert_array_equal(times, [10.0, 11.0])
+    np.testing.assert_array_equal(freq, np.arange(1000, 1100))
+    np.testing.assert_array_equal(data, buffer_db[s1][:2, 1000:1100])
+
+    times, freq, data = db.fetch_rfi(10.5, 100, s1, 100, 200)
+    np.testing.assert_array_equal(times, [11.0])
+    np.testing.assert_array_equal(data, buffer_db[s1][1:2, 100:200])
+
+    # The time axis doesn't depend on which chunks the range covers, times without
+    # data in the range are NaN
+    times, freq, data = db.fetch_rfi(0, 100, s1, 1500, 2000)
+    np.testing.assert_array_equal(times, [10.0, 11.0])
+    np.testing.assert_array_equal(data, buffer_db[s1][:2, 1500:2000])
+    assert np.isnan(data[1]).all()
+
+    # The frequency axis only covers the chunks present in the time range
+    times, freq, data = db.fetch_rfi(10.5, 100, s1, 1000, 1100)
+    np.testing.assert_array_equal(times, [11.0])
+    np.testing.assert_array_equal(freq, np.arange(1000, 1024))
+
+
+def test_fetch_empty(buffer_db: dict):
+    """Test empty time and frequency ranges."""
+    s1 = db.SpectrumType.STAGE_1
+
+    times, freq, data = db.fetch_rfi(50, 100, s1)
+    assert times.shape == (0,)
+    assert data.shape == (0, 0)
+
+    # An empty frequency range, or one beyond the stored chunks, still gives the times
+    ranges = [(None, 0), (1500, 1500), (1500, 1000), (2048, 3000), (4096, None)]
+    for freq_start, freq_end in ranges:
+        times, freq, data = db.fetch_rfi(0, 100, s1, freq_start, freq_end)
+        np.testing.assert_array_equal(times, [10.0, 11.0])
+        assert freq.shape == (0,)
+        assert data.shape == (2, 0)
@@ -100,3 +100,80 @@ def test_existing():
 
     p.push("b", 17, priority="z")
     assert p["b"] == 6
+
+
+def test_remove():
+    """Test removing specific keys."""
+    p = prioritymap.PriorityMap(4)
+
+    p.push("a", 5)
+    p.push("b", 6)
+    p.push("c", 7)
+
+    assert p.remove("a") == 5
+    assert len(p) == 2
+    assert "a" not in p
+    assert p.peek() == ("b", "b")
+
+    with pytest.raises(KeyError):
+        p.remove("a")
+
+    # Reinsert a removed key
+    p.push("a", 15)
+    p.push("d", 8)
+    assert len(p) == 4
+
+    assert p.remove("c") == 7
+
+    assert p.pop() == ("a", 15)
+    assert p.pop() == ("b", 6)
+    assert p.pop() == ("d", 8)
+    assert len(p) == 0
+
+    with pytest.raises(IndexError):
+        p.pop()
+
+
+def test_extend():
+    """Test adding many items at once."""
+    p = prioritymap.PriorityMap(5)
+
+    p.push("c", 7)
+    p.extend([("e", 9, None), ("a", 5, None), ("d", 8, "0")])
+
+    assert len(p) == 4
+    assert p["a"] == 5
+    assert p.pop() == ("d", 8)
+    assert p.pop() == ("a", 5)
+
+    # Adding an existing key or too many items should not change the map
+    with pytest.raises(KeyError):
+        p.extend([("f", 10, None), ("c", 7, None)])
+    with pytest.raises(prioritymap.FullContainerError):
+        p.extend([("f", 10, None), ("g", 11, None), ("h", 12, None), ("i", 13, None)])
+
+    assert len(p) == 2
+    assert "f" not in p
+    assert p.pop() == ("c", 7)
+
+    p = prioritymap.PriorityMap(5, strict=True, ignore_existing=True)
+    p.extend([("b", 6, None), ("b", 0, None), ("c", 7, None)])
+    assert p["b"] == 6
+
+    with pytest.raises(prioritymap.OutOfOrderError):
+        p.extend([("d", 8, None), ("a", 5, None)])
+    assert len(p) == 2
+
+
+def test_from_items():
+    """Test constructing a map from many items."""
+    p = prioritymap.PriorityMap.from_items(
+        [("c", 7, None), ("a", 5, None), ("b", 6, None)], 4
+    )
+
+    assert len(p) == 3
+    assert p.peek() == ("a", "a")
+    assert [p.pop() for _ in range(3)] == [("a", 5), ("b", 6), ("c", 7)]
+
+    with pytest.raises(prioritymap.FullContainerError):
+        prioritymap.PriorityMap.from_items([(i, i, None) for i in range(3)], 2)
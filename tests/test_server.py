@@ -0,0 +1,150 @@
+"""Test the HTTP server for the buffer data."""
+
+import asyncio
+import gzip
+import json
+from io import BytesIO
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from rfiscrape import db, server, util
+
+TIMES = np.arange(10.0, 15.0)
+
+
+@pytest.fixture()
+def buffer_db(tmp_path: Path):
+    """A buffer db with a single chunk of STAGE_1 data at each time."""
+    db.connect(str(tmp_path / "buffer.db"), readonly=False)
+
+    rng = np.random.default_rng(54321)
+    data = rng.uniform(size=(len(TIMES), 1024)).astype(np.float32)
+    spec, enc = db.SpectrumType.STAGE_1, db.EncodingType.RAW
+    db.insert_rfi(
+        [
+            (t, 0, spec.value, enc.value, db.encode(spec, enc, d))
+            for t, d in zip(TIMES, data)
+        ]
+    )
+
+    yield data
+
+    db.close()
+
+
+async def _get(
+    params: dict | None = None,
+    json_body: dict | None = None,
+    headers: dict | None = None,
+) -> tuple[int, dict, bytes]:
+    """Query the server and return the status, headers and undecoded body."""
+    app = web.Application()
+    app.add_routes([web.get("/query", server.get_rfi)])
+
+    async with TestClient(TestServer(app), auto_decompress=False) as c:
+        r = await c.get("/query", params=params, json=json_body, headers=headers)
+        return r.status, dict(r.headers), await r.read()
+
+
+def _decode(type_: str, body: bytes) -> dict[str, np.ndarray]:
+    """Decode a response of the given type into its arrays."""
+    match type_:
+        case "json":
+            return {k: util.json_to_numpy(v) for k, v in json.loads(body).items()}
+        case "binary":
+            return util.unpack_arrays(body)
+        case "numpy":
+            with np.load(BytesIO(body)) as npz:
+                return dict(npz)
+        case "hdf5":
+            with h5py.File(BytesIO(body), "r") as fh:
+                return {
+                    "time": fh["index_map/time"][:],
+                    "freq": fh["index_map/freq"][:],
+                    "data": fh["rfi"][:],
+                }
+        case _:
+            raise ValueError(f"Unknown type {type_}.")
+
+
+@pytest.mark.parametrize("type_", ["json", "binary", "numpy", "hdf5"])
+@pytest.mark.parametrize("accept", ["gzip", "identity"])
+def test_types(buffer_db: np.ndarray, type_: str, accept: str):
+    """Test each response type, with and without compression."""
+    params = {"start_time": "11", "end_time": "100", "type": type_}
+
+    status, headers, body = asyncio.run(
+        _get(params, headers={"Accept-Encoding": accept})
+    )
+    assert status == 200
+
+    # Any length given must be that of the body actually sent, not the uncompressed one
+    assert int(headers.get("Content-Length", len(body))) == len(body)
+
+    # HDF5 files compress their own datasets, so are never compressed again
+    if accept == "gzip" and type_ != "hdf5":
+        assert headers.get("Content-Encoding") == "gzip"
+        body = gzip.decompress(body)
+    else:
+        assert "Content-Encoding" not in headers
+
+    arrays = _decode(type_, body)
+    np.testing.assert_array_equal(arrays["time"], TIMES[1:])
+    np.testing.assert_array_equal(arrays["freq"], np.arange(1024))
+    np.testing.assert_array_equal(arrays["data"], buffer_db[1:])
+
+
+def test_json_query(buffer_db: np.ndarray):
+    """Test giving the query as a JSON body with a frequency range."""
+    query = {
+        "start_time": 0,
+        "end_time": 12,
+        "freq_start": 100,
+        "freq_end": 200,
+        "type": "binary",
+    }
+
+    status, _, body = asyncio.run(
+        _get(json_body=query, headers={"Accept-Encoding": "identity"})
+    )
+    assert status == 200
+
+    arrays = util.unpack_arrays(body)
+    np.testing.assert_array_equal(arrays["time"], TIMES[:2])
+    np.testing.assert_array_equal(arrays["freq"], np.arange(100, 200))
+    np.testing.assert_array_equal(arrays["data"], buffer_db[:2, 100:200])
+
+
+@pytest.mark.parametrize(
+    ("params", "json_body", "reason"),
+    [
+        (None, None, "Supply a query"),
+        ({"start_time": "0"}, {"end_time": 1}, "not both"),
+        ({"start_time": "0"}, None, "Start and end times are required"),
+        ({"start_time": "0", "end_time": "not a time"}, None, "Error parsing times"),
+        (
+            {"start_time": "0", "end_time": "1", "freq_start": "1.5"},
+            None,
+            "Frequency range must be integers",
+        ),
+        (
+            {"start_time": "0", "end_time": "1", "spectrum_type": "STAGE_3"},
+            None,
+            "Unknown spectrum type",
+        ),
+        ({"start_time": "0", "end_time": "1", "type": "csv"}, None, "Unknown type"),
+    ],
+)
+def test_bad_query(
+    buffer_db: np.ndarray, params: dict | None, json_body: dict | None, reason: str
+):
+    """Test that invalid queries are rejected."""
+    status, _, body = asyncio.run(_get(params, json_body))
+
+    assert status == 400
+    assert reason in body.decode()
@@ -0,0 +1,55 @@
+"""Test the utility functions."""
+
+import numpy as np
+import pytest
+
+from rfiscrape import util
+
+
+def test_convert_unix():
+    """Test converting times to Unix timestamps."""
+    assert util.convert_unix(3) == 3.0
+    assert util.convert_unix("1.5") == 1.5
+    assert util.convert_unix("2024-01-01T00:00:00") == 1704067200.0
+    assert util.convert_unix("2024-01-01T01:00:00+01:00") == 1704067200.0
+    assert util.convert_unix("2024-01-01T00:00:00Z") == 1704067200.0
+    assert util.convert_unix("Jan 1 2024 00:00") == 1704067200.0
+
+    with pytest.raises(RuntimeError):
+        util.convert_unix("not a time")
+
+
+def test_numpy_json():
+    """Test the JSON round trip including non-contiguous arrays."""
+    arr = np.arange(20, dtype=np.float32).reshape(4, 5)[:, 1:3]
+
+    dec = util.json_to_numpy(util.numpy_to_json(arr))
+
+    np.testing.assert_array_equal(dec, arr)
+
+    # Check that big-endian arrays are described correctly
+    arr = np.arange(5, dtype=">i4")
+    jdict = util.numpy_to_json(arr)
+
+    assert jdict["dtype"] == "int32"
+    np.testing.assert_array_equal(util.json_to_numpy(jdict), arr)
+
+
+def test_pack_arrays():
+    """Test the binary message round trip."""
+    arrays = {
+        "time": np.arange(3, dtype=np.float64),
+        "freq": np.arange(4, dtype=">i4"),
+        "data": np.arange(12, dtype=np.float32).reshape(3, 4)[:, ::2],
+        "empty": np.zeros((0, 4), dtype=np.float32),
+    }
+
+    unpacked = util.unpack_arrays(util.pack_arrays(arrays))
+
+    assert list(unpacked) == list(arrays)
+    for name, arr in arrays.items():
+        assert unpacked[name].shape == arr.shape
+        np.testing.assert_array_equal(unpacked[name], arr)
+
+    with pytest.raises(RuntimeError):
+        util.unpack_arrays(util.pack_arrays(arrays)[:-4])